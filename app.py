@@ -1,12 +1,21 @@
-from flask import Flask, request, render_template, send_file, jsonify, abort, url_for
+from flask import Flask, request, render_template, send_file, jsonify, abort, url_for, Response, stream_with_context
 import os
 from pathlib import Path
 from werkzeug.utils import secure_filename
-from stixis_processor import StixisProcessor
-from stixis_color_processor import StixisColorProcessor
+from processor_factory import create_processor
 from PIL import Image  # Use PIL instead of imghdr
 from image_handler import ImageHandler
+from stixis_scene import CircleScene
+from tile_pyramid import TilePyramid
+from batch_processor import BatchProcessor
+from palette_store import PaletteStore, extract_palette
+from variant_renderer import render_variants
+from functools import lru_cache
+from io import BytesIO
+import json
 import time
+import uuid
+import zipfile
 
 app = Flask(__name__)
 
@@ -14,14 +23,31 @@ app = Flask(__name__)
 BASE_DIR = Path(__file__).resolve().parent
 UPLOAD_FOLDER = BASE_DIR / 'uploads'
 OUTPUT_FOLDER = BASE_DIR / 'output'
+PALETTE_FOLDER = BASE_DIR / 'palettes'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+TILE_SIZE = 256
+TILE_CACHE_SECONDS = 3600  # Matches the processed file lifetime
+MAX_VARIANTS = 12
+BATCH_WORKERS = int(os.environ.get('STIXIS_BATCH_WORKERS', os.cpu_count() or 2))
+MAX_UPLOAD_SIZE = 16 * 1024 * 1024  # 16MB max file size
+BATCH_MAX_CONTENT_LENGTH = int(os.environ.get('STIXIS_BATCH_MAX_BYTES', 512 * 1024 * 1024))
 
 # Ensure folders exist
 UPLOAD_FOLDER.mkdir(exist_ok=True)
 OUTPUT_FOLDER.mkdir(exist_ok=True)
 
+palette_store = PaletteStore(PALETTE_FOLDER)
+
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# The global limit allows batch uploads; other routes are limited in check_content_length()
+app.config['MAX_CONTENT_LENGTH'] = max(MAX_UPLOAD_SIZE, BATCH_MAX_CONTENT_LENGTH)
+
+@app.before_request
+def check_content_length():
+    """Reject request bodies above the limit of the route."""
+    limit = BATCH_MAX_CONTENT_LENGTH if request.endpoint == 'batch_process' else MAX_UPLOAD_SIZE
+    if request.content_length is not None and request.content_length > limit:
+        return jsonify({'error': f"Request exceeds the {limit} byte limit"}), 413
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -36,6 +62,38 @@ def validate_image(stream):
     except Exception:
         return None
 
+def get_processing_params(form):
+    """Read processing parameters from a submitted form."""
+    use_custom_grid = form.get('use_custom_grid') == 'true'
+    return {
+        'num_colors': int(form.get('num_colors', 5)),
+        'grid_size': int(form.get('grid_size', 0)) if use_custom_grid else None,
+        'smoothing': form.get('use_smoothing') == 'true',
+        'smoothing_sigma': float(form.get('smoothing_sigma', 1.5)),
+        'enhance_contrast': form.get('enhance_contrast') == 'true',
+        'invert': form.get('invert') == 'true',
+        'processor_mode': form.get('processor_mode', 'grayscale'),
+        'color_palette_size': int(form.get('color_palette_size', 8)),
+        'brightness_mapping': form.get('brightness_mapping', 'linear'),
+        'gamma': float(form.get('gamma', 2.2)),
+        'upscale_factor': int(form.get('upscale_factor', 1)),
+        'output_format': form.get('output_format', 'png'),
+        'palette_id': form.get('palette_id') or None,
+    }
+
+def attach_palette(params):
+    """Load the stored palette referenced by params, returning an error message on failure."""
+    if not params['palette_id']:
+        return None
+    try:
+        palette = palette_store.get(params['palette_id'])
+    except ValueError as e:
+        return str(e)
+    if palette is None:
+        return "Palette not found"
+    params['palette'] = palette
+    return None
+
 @app.route('/', methods=['GET'])
 def home():
     return render_template('upload.html')
@@ -67,56 +125,22 @@ def process_image():
         file.save(save_path)
 
         # Get parameters from form
-        num_colors = int(request.form.get('num_colors', 5))
-        use_custom_grid = request.form.get('use_custom_grid') == 'true'
-        grid_size = int(request.form.get('grid_size', 0)) if use_custom_grid else None
-        use_smoothing = request.form.get('use_smoothing') == 'true'
-        smoothing_sigma = float(request.form.get('smoothing_sigma', 1.5))
-        enhance_contrast = request.form.get('enhance_contrast') == 'true'
-        invert = request.form.get('invert') == 'true'
-        processor_mode = request.form.get('processor_mode', 'grayscale')
-        color_palette_size = int(request.form.get('color_palette_size', 8))
-        brightness_mapping = request.form.get('brightness_mapping', 'linear')
-        gamma = float(request.form.get('gamma', 2.2))
-        upscale_factor = int(request.form.get('upscale_factor', 1))
+        params = get_processing_params(request.form)
+        output_format = params['output_format']
         
         print(f"Creating processor with parameters:")
-        print(f"- num_colors: {num_colors}")
-        print(f"- grid_size: {grid_size}")
-        print(f"- smoothing: {use_smoothing}")
-        print(f"- smoothing_sigma: {smoothing_sigma}")
-        print(f"- enhance_contrast: {enhance_contrast}")
-        print(f"- invert: {invert}")
-        print(f"- processor_mode: {processor_mode}")
-        print(f"- color_palette_size: {color_palette_size}")
-        print(f"- brightness_mapping: {brightness_mapping}")
-        print(f"- gamma: {gamma}")
-        print(f"- upscale_factor: {upscale_factor}")
+        for name, value in params.items():
+            print(f"- {name}: {value}")
         
-        # Choose processor based on mode
-        if processor_mode == 'color':
-            processor = StixisColorProcessor(
-                num_colors=num_colors,
-                grid_size=grid_size,
-                smoothing=use_smoothing,
-                smoothing_sigma=smoothing_sigma,
-                enhance_contrast=enhance_contrast,
-                color_palette_size=color_palette_size,
-                invert=invert,
-                upscale_factor=upscale_factor
-            )
-        else:
-            processor = StixisProcessor(
-                num_colors=num_colors,
-                grid_size=grid_size,
-                smoothing=use_smoothing,
-                smoothing_sigma=smoothing_sigma,
-                enhance_contrast=enhance_contrast,
-                invert=invert,
-                brightness_mapping=brightness_mapping,
-                gamma=gamma,
-                upscale_factor=upscale_factor
-            )
+        palette_error = attach_palette(params)
+        if palette_error:
+            return jsonify({'error': palette_error}), 400
+        
+        # Several variants share one decode and statistics pass
+        if request.form.get('variants'):
+            return process_variants(save_path, filename)
+        
+        processor = create_processor(params)
         
         print(f"Processor created with invert={processor.invert}")
         
@@ -124,6 +148,38 @@ def process_image():
         try:
             print("Loading and processing image")
             input_image = Image.open(save_path)
+            
+            if output_format == 'tiles':
+                # Store the circle description; tiles are rendered on demand.
+                # Every render gets its own id, since tiles are cached publicly
+                scene = processor.compute_scene(input_image)
+                scene_id = f"processed_{filename.rsplit('.', 1)[0]}_{uuid.uuid4().hex[:12]}"
+                scene.save(UPLOAD_FOLDER / f"{scene_id}.scene.json")
+                
+                if save_path.exists():
+                    save_path.unlink()
+                
+                return jsonify({
+                    'status': 'success',
+                    'message': 'Tile pyramid created successfully',
+                    'width': scene.width,
+                    'height': scene.height,
+                    'tile_size': TILE_SIZE,
+                    'dzi_url': url_for('tile_descriptor', scene_id=scene_id, _external=True)
+                }), 200
+            
+            if output_format in ('scene', 'scene_json'):
+                # Send the circle description for client-side rendering
+                scene = processor.compute_scene(input_image)
+                
+                if save_path.exists():
+                    save_path.unlink()
+                
+                print(f"Scene complete with {len(scene.circles)} circles")
+                if output_format == 'scene_json':
+                    return jsonify(scene.to_compact_dict()), 200
+                return app.response_class(scene.to_bytes(), mimetype='application/octet-stream')
+            
             output_image = processor.process(input_image)
             
             # Save the processed image
@@ -167,6 +223,145 @@ def process_image():
             except Exception as e:
                 print(f"Cleanup error: {str(e)}")
 
+def get_variant_params(form):
+    """Build one parameter set per entry of the JSON 'variants' form field.
+
+    Each entry overrides form fields, e.g. [{"invert": "true"},
+    {"processor_mode": "color"}]; everything else comes from the form.
+    """
+    overrides = json.loads(form['variants'])
+    if not isinstance(overrides, list) or not overrides:
+        raise ValueError("variants must be a non-empty JSON list")
+    if len(overrides) > MAX_VARIANTS:
+        raise ValueError(f"At most {MAX_VARIANTS} variants are allowed")
+    
+    variants = []
+    for override in overrides:
+        if not isinstance(override, dict):
+            raise ValueError("Each variant must be a JSON object")
+        merged = form.to_dict()
+        merged.pop('variants')
+        for key, value in override.items():
+            merged[key] = str(value).lower() if isinstance(value, bool) else str(value)
+        variants.append(get_processing_params(merged))
+    return overrides, variants
+
+def process_variants(save_path, filename):
+    """Render all requested variants of an uploaded image together."""
+    try:
+        overrides, variants = get_variant_params(request.form)
+    except ValueError as e:
+        return jsonify({'error': f"Invalid variants: {str(e)}"}), 400
+    
+    for params in variants:
+        palette_error = attach_palette(params)
+        if palette_error:
+            return jsonify({'error': palette_error}), 400
+    
+    print(f"Rendering {len(variants)} variants")
+    with Image.open(save_path) as input_image:
+        results = render_variants(input_image, variants, max_workers=BATCH_WORKERS, png=True)
+    
+    base_name = f"processed_{filename.rsplit('.', 1)[0]}"
+    
+    if request.form.get('variants_output') == 'zip':
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+            for index, (processor, png) in enumerate(results):
+                archive.writestr(f"{base_name}_v{index}.png", png)
+        buffer.seek(0)
+        return send_file(buffer, mimetype='application/zip', as_attachment=True,
+                         download_name=f"{base_name}_variants.zip")
+    
+    # Concurrent requests for the same file name must not share outputs
+    request_id = uuid.uuid4().hex[:12]
+    outputs = []
+    for index, ((processor, png), override) in enumerate(zip(results, overrides)):
+        output_filename = f"{base_name}_{request_id}_v{index}.png"
+        (UPLOAD_FOLDER / output_filename).write_bytes(png)
+        outputs.append({
+            'variant': override,
+            'download_url': url_for('download_file', filename=output_filename, _external=True)
+        })
+    
+    return jsonify({
+        'status': 'success',
+        'message': f"{len(outputs)} variants processed successfully",
+        'variants': outputs
+    }), 200
+
+@app.route('/batch', methods=['POST'])
+def batch_process():
+    try:
+        params = get_processing_params(request.form)
+    except ValueError as e:
+        return jsonify({'error': f"Invalid parameters: {str(e)}"}), 400
+    palette_error = attach_palette(params)
+    if palette_error:
+        return jsonify({'error': palette_error}), 400
+    
+    archive = request.files.get('archive')
+    if archive and archive.filename != '':
+        try:
+            entries = BatchProcessor.entries_from_archive(archive.stream, MAX_UPLOAD_SIZE)
+        except zipfile.BadZipFile:
+            return jsonify({'error': "Invalid zip archive"}), 400
+    else:
+        files = [f for f in request.files.getlist('files') if f.filename != '']
+        if not files:
+            return jsonify({'error': "No files provided"}), 400
+        entries = BatchProcessor.entries_from_files(files)
+    
+    print(f"Starting batch with {BATCH_WORKERS} workers")
+    batch = BatchProcessor(
+        params,
+        max_workers=BATCH_WORKERS,
+        allowed_extensions=ALLOWED_EXTENSIONS
+    )
+    
+    return Response(
+        stream_with_context(batch.stream(entries)),
+        mimetype='application/zip',
+        headers={'Content-Disposition': 'attachment; filename=stixis_batch.zip'}
+    )
+
+@app.route('/palettes', methods=['POST'])
+def create_palette():
+    files = [f for f in request.files.getlist('files') + request.files.getlist('file')
+             if f.filename != '']
+    if not files:
+        return jsonify({'error': "No files provided"}), 400
+    
+    images = []
+    for file in files:
+        if not allowed_file(file.filename) or not validate_image(file.stream):
+            return jsonify({'error': f"Invalid image file: {file.filename}"}), 400
+        images.append(Image.open(file.stream))
+    
+    try:
+        palette_size = int(request.form.get('color_palette_size', 8))
+        palette = extract_palette(images, palette_size)
+        palette_id = palette_store.add(palette)
+    except Exception as e:
+        print(f"Palette error: {str(e)}")
+        return jsonify({'error': f"Error extracting palette: {str(e)}"}), 500
+    
+    return jsonify({
+        'status': 'success',
+        'palette_id': palette_id,
+        'colors': palette.tolist()
+    }), 200
+
+@app.route('/palettes/<palette_id>', methods=['GET'])
+def get_palette(palette_id):
+    try:
+        palette = palette_store.get(palette_id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    if palette is None:
+        return jsonify({'error': "Palette not found"}), 404
+    return jsonify({'palette_id': palette_id, 'colors': palette.tolist()}), 200
+
 # Add cleanup schedule for processed files
 def cleanup_old_files():
     """Clean up files older than 1 hour"""
@@ -178,6 +373,45 @@ def cleanup_old_files():
             except Exception as e:
                 print(f"Cleanup error for {file_path}: {str(e)}")
 
+@lru_cache(maxsize=16)
+def load_pyramid(scene_path, mtime):
+    """Load a tile pyramid, cached per scene file version."""
+    return TilePyramid(CircleScene.load(scene_path), tile_size=TILE_SIZE)
+
+def get_pyramid(scene_id):
+    """Return the pyramid for a scene id, or None if it does not exist."""
+    scene_path = UPLOAD_FOLDER / f"{secure_filename(scene_id)}.scene.json"
+    if not scene_path.exists():
+        return None
+    return load_pyramid(str(scene_path), scene_path.stat().st_mtime)
+
+@app.route('/tiles/<scene_id>.dzi')
+def tile_descriptor(scene_id):
+    pyramid = get_pyramid(scene_id)
+    if pyramid is None:
+        return jsonify({'error': "Scene not found"}), 404
+    
+    response = app.response_class(pyramid.dzi_xml(), mimetype='application/xml')
+    response.cache_control.public = True
+    response.cache_control.max_age = TILE_CACHE_SECONDS
+    return response
+
+@app.route('/tiles/<scene_id>_files/<int:level>/<int:col>_<int:row>.png')
+def tile_image(scene_id, level, col, row):
+    pyramid = get_pyramid(scene_id)
+    if pyramid is None:
+        return jsonify({'error': "Scene not found"}), 404
+    if not pyramid.is_valid_tile(level, col, row):
+        return jsonify({'error': "Tile not found"}), 404
+    
+    buffer = BytesIO()
+    pyramid.render_tile(level, col, row).save(buffer, format='PNG')
+    buffer.seek(0)
+    
+    response = send_file(buffer, mimetype='image/png', max_age=TILE_CACHE_SECONDS)
+    response.cache_control.public = True
+    return response
+
 @app.route('/download/<filename>')
 def download_file(filename):
     if '..' in filename or filename.startswith('/'):
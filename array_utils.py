@@ -0,0 +1,106 @@
+import numpy as np
+from PIL import Image
+
+def validate_array(pixels):
+    """Check that an array is a uint8 HxW, HxWx3 or HxWx4 image."""
+    if not isinstance(pixels, np.ndarray):
+        raise ValueError("Expected a numpy array")
+    if pixels.dtype != np.uint8:
+        raise ValueError(f"Expected a uint8 array, got {pixels.dtype}")
+    if pixels.ndim == 2 or (pixels.ndim == 3 and pixels.shape[2] in (3, 4)):
+        if pixels.shape[0] == 0 or pixels.shape[1] == 0:
+            raise ValueError("Array must not be empty")
+        return
+    raise ValueError(f"Expected an HxW, HxWx3 or HxWx4 array, got shape {pixels.shape}")
+
+def image_to_array(image, fallback_mode):
+    """Return a PIL image as an array, converting unsupported modes first."""
+    if image.mode not in ('L', 'RGB', 'RGBA'):
+        image = image.convert(fallback_mode)
+    return np.asarray(image)
+
+ROW_BLOCK = 256  # Rows converted at a time, bounding temporaries to a few MB
+
+def _convert_rows(pixels, channels, convert):
+    """Run a PIL conversion over an image array in row blocks.
+
+    Only one block at a time is copied into PIL, so large frames never
+    need full-size temporaries beyond the uint8 output.
+    """
+    shape = pixels.shape[:2] + ((channels,) if channels > 1 else ())
+    output = np.empty(shape, dtype=np.uint8)
+    for y in range(0, pixels.shape[0], ROW_BLOCK):
+        block = Image.fromarray(np.ascontiguousarray(pixels[y:y + ROW_BLOCK]))
+        output[y:y + ROW_BLOCK] = np.asarray(convert(block))
+    return output
+
+def _composite_image(image):
+    """Composite an RGBA image over opaque black, as the processors always have."""
+    background = Image.new('RGBA', image.size, (0, 0, 0, 255))
+    return Image.alpha_composite(background, image)
+
+def image_to_gray_array(image):
+    """Return a PIL image as a grayscale array, converting inside PIL.
+
+    Transparent RGBA pixels become black. Converting before leaving PIL
+    avoids a full-size RGB copy when only brightness is needed.
+    """
+    if image.mode == 'RGBA':
+        image = _composite_image(image)
+    if image.mode != 'L':
+        image = image.convert('L')
+    return np.asarray(image)
+
+def composite_on_black(pixels):
+    """Composite an RGBA array over opaque black, returning RGB."""
+    return _convert_rows(pixels, 3, lambda image: _composite_image(image).convert('RGB'))
+
+def rgb_to_gray(rgb):
+    """Convert an RGB array to grayscale with PIL's 'L' conversion."""
+    return _convert_rows(rgb, 1, lambda image: image.convert('L'))
+
+def to_gray(pixels):
+    """Return the grayscale version of an image array.
+
+    HxW input is returned as-is, without copying.
+    """
+    if pixels.ndim == 2:
+        return pixels
+    if pixels.shape[2] == 4:
+        return _convert_rows(pixels, 1, lambda image: _composite_image(image).convert('L'))
+    return rgb_to_gray(pixels)
+
+def resize_array(pixels, width, height, resample):
+    """Resize an image array through PIL, returning a new array."""
+    return np.asarray(Image.fromarray(pixels).resize((width, height), resample))
+
+def prepare_output(out, shape):
+    """Return a zeroed output array, reusing the caller's buffer if given."""
+    if out is None:
+        return np.zeros(shape, dtype=np.uint8)
+    if out.shape != shape or out.dtype != np.uint8:
+        raise ValueError(f"Output buffer must be uint8 with shape {shape}, "
+                         f"got {out.dtype} with shape {out.shape}")
+    if not out.flags.writeable:
+        raise ValueError("Output buffer is read-only")
+    out.fill(0)
+    return out
+
+def render_circles(output, circles):
+    """Draw filled circles into an array one scanline at a time.
+
+    Produces the same pixels as drawing each point with ImageDraw, with
+    anything outside the array clipped.
+    """
+    height, width = output.shape[:2]
+    for center_x, center_y, radius, color in circles:
+        for y in range(-radius, radius + 1):
+            row = center_y + y
+            if row < 0 or row >= height:
+                continue
+            x_val = int((radius * radius - y * y) ** 0.5)
+            x_start = max(center_x - x_val, 0)
+            x_end = min(center_x + x_val + 1, width)
+            if x_start < x_end:
+                output[row, x_start:x_end] = color
+    return output
@@ -0,0 +1,264 @@
+import json
+import multiprocessing
+import shutil
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from pathlib import PurePosixPath
+from PIL import Image
+from processor_factory import create_processor
+
+class _StreamBuffer:
+    """Write-only file object that collects bytes written by ZipFile.
+
+    It has no tell()/seek(), so ZipFile falls back to streaming mode and
+    writes data descriptors instead of seeking back to patch headers.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """Return and forget everything written so far."""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def _process_entry(name, data, params):
+    """Process a single image in a worker process.
+
+    Returns PNG bytes or an error message.
+    """
+    try:
+        with Image.open(BytesIO(data)) as image:
+            image.verify()
+        image = Image.open(BytesIO(data))
+        output = create_processor(params).process(image)
+        buffer = BytesIO()
+        output.save(buffer, format='PNG', optimize=False)
+        return buffer.getvalue(), None
+    except Exception as e:
+        print(f"Batch processing error for {name}: {str(e)}")
+        return None, str(e)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def shared_pool(max_workers):
+    """Return the process pool shared by every batch in this process.
+
+    The pool is created on first use, so the total number of worker
+    processes stays at max_workers however many batches run at once. The
+    forkserver start method (where available) keeps workers from being
+    forked out of a multithreaded server.
+    """
+    global _pool
+    with _pool_lock:
+        # A worker may have died while the pool was idle
+        if _pool is not None and getattr(_pool, '_broken', False):
+            _pool.shutdown(wait=False)
+            _pool = None
+        if _pool is None:
+            context = None
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+        return _pool
+
+def _discard_pool(pool):
+    """Drop a broken pool so the next batch starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+class BatchProcessor:
+    """Process many images in the shared process pool and stream the results as a zip."""
+
+    def __init__(self, params, max_workers=4,
+                 allowed_extensions=('png', 'jpg', 'jpeg'), max_files=500):
+        self.params = params
+        self.max_workers = max(1, max_workers)
+        self.allowed_extensions = set(allowed_extensions)
+        self.max_files = max_files
+
+    @staticmethod
+    def _spool(stream):
+        """Copy an upload into a temporary file owned by the batch.
+
+        Flask closes uploaded files when the view returns, before a
+        streamed response has read them.
+        """
+        spooled = tempfile.TemporaryFile()
+        shutil.copyfileobj(stream, spooled)
+        spooled.seek(0)
+        return spooled
+
+    @staticmethod
+    def entries_from_archive(stream, max_entry_size=None):
+        """Return (name, reader) pairs for every file in a zip archive.
+
+        The archive is copied and opened eagerly so a corrupt upload raises
+        zipfile.BadZipFile before any response is streamed. Readers of
+        entries whose uncompressed size exceeds max_entry_size raise
+        ValueError instead of decompressing them.
+        """
+        spooled = BatchProcessor._spool(stream)
+        try:
+            archive = zipfile.ZipFile(spooled)
+        except zipfile.BadZipFile:
+            spooled.close()
+            raise
+
+        def read(info):
+            if max_entry_size is not None and info.file_size > max_entry_size:
+                raise ValueError(f"File exceeds the {max_entry_size} byte limit")
+            return archive.read(info)
+
+        def generate():
+            with spooled, archive:
+                for info in archive.infolist():
+                    if info.is_dir() or info.filename.startswith('__MACOSX/'):
+                        continue
+                    yield info.filename, lambda info=info: read(info)
+
+        return generate()
+
+    @staticmethod
+    def entries_from_files(files):
+        """Return (name, reader) pairs for uploaded multipart files."""
+        spooled = [(f.filename, BatchProcessor._spool(f.stream)) for f in files]
+
+        def read(upload):
+            with upload:
+                return upload.read()
+
+        return ((name, lambda upload=upload: read(upload)) for name, upload in spooled)
+
+    def _allowed(self, name):
+        return '.' in name and name.rsplit('.', 1)[1].lower() in self.allowed_extensions
+
+    def _output_name(self, name, used_names):
+        """Build a safe, unique archive path for the output of an entry."""
+        parts = [p for p in name.replace('\\', '/').split('/') if p not in ('', '.', '..')]
+        base = str(PurePosixPath(*parts).with_suffix('')) if parts else 'image'
+        output_name = f"{base}_stixis.png"
+        counter = 1
+        while output_name in used_names:
+            output_name = f"{base}_stixis_{counter}.png"
+            counter += 1
+        used_names.add(output_name)
+        return output_name
+
+    def stream(self, entries):
+        """Yield chunks of a zip archive as each entry finishes processing.
+
+        At most 2 * max_workers images of this batch are read or in flight
+        at any time, so memory stays bounded regardless of the batch size.
+        Results are written in completion order; manifest.json is written
+        last, also when a worker process dies and the rest of the batch is
+        abandoned.
+        """
+        buffer = _StreamBuffer()
+        archive = zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED)
+        manifest = []
+        used_names = {'manifest.json'}
+        entries = iter(entries)
+        pending = {}
+        exhausted = False
+        broken = False
+        count = 0
+
+        pool = shared_pool(self.max_workers)
+        try:
+            while True:
+                # Keep the pool busy without reading the whole batch up front
+                while not exhausted and not broken and len(pending) < self.max_workers * 2:
+                    try:
+                        name, reader = next(entries)
+                    except StopIteration:
+                        exhausted = True
+                        break
+
+                    count += 1
+                    if count > self.max_files:
+                        manifest.append({'input': name, 'status': 'error',
+                                         'error': f"Batch limit of {self.max_files} files exceeded"})
+                        continue
+                    if not self._allowed(name):
+                        manifest.append({'input': name, 'status': 'error',
+                                         'error': "Invalid file type"})
+                        continue
+                    try:
+                        data = reader()
+                    except Exception as e:
+                        manifest.append({'input': name, 'status': 'error', 'error': str(e)})
+                        continue
+                    try:
+                        pending[pool.submit(_process_entry, name, data, self.params)] = name
+                    except (BrokenProcessPool, RuntimeError):
+                        # Another batch saw the pool break and shut it down
+                        manifest.append({'input': name, 'status': 'error',
+                                         'error': "Worker process died"})
+                        broken = True
+
+                if not pending and not broken:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = pending.pop(future)
+                    try:
+                        data, error = future.result()
+                    except BrokenProcessPool:
+                        # A worker died and the pool cannot run anything else
+                        manifest.append({'input': name, 'status': 'error',
+                                         'error': "Worker process died"})
+                        broken = True
+                        continue
+                    if error is not None:
+                        manifest.append({'input': name, 'status': 'error', 'error': error})
+                        continue
+
+                    output_name = self._output_name(name, used_names)
+                    archive.writestr(output_name, data)
+                    manifest.append({'input': name, 'status': 'success', 'output': output_name})
+                    yield buffer.drain()
+
+                if not broken:
+                    continue
+
+                # Every entry in flight failed with the pool; the rest are not
+                # started, and the archive is still finished normally
+                _discard_pool(pool)
+                for name in pending.values():
+                    manifest.append({'input': name, 'status': 'error',
+                                     'error': "Worker process died"})
+                pending.clear()
+                for name, _ in entries:
+                    manifest.append({'input': name, 'status': 'error',
+                                     'error': "Batch aborted after a worker process died"})
+                break
+        finally:
+            # The pool outlives this batch, so drop work nobody will collect
+            for future in pending:
+                future.cancel()
+
+        archive.writestr('manifest.json', json.dumps({
+            'processed': sum(1 for m in manifest if m['status'] == 'success'),
+            'failed': sum(1 for m in manifest if m['status'] == 'error'),
+            'files': manifest
+        }, indent=2))
+        archive.close()
+        yield buffer.drain()
@@ -0,0 +1,233 @@
+import argparse
+import itertools
+import json
+import sys
+from pathlib import Path
+import numpy as np
+from PIL import Image, ImageOps
+from stixis_processor import StixisProcessor
+from stixis_color_processor import StixisColorProcessor
+
+BASE_DIR = Path(__file__).resolve().parent
+GOLDEN_DIR = BASE_DIR / 'golden'
+BUNDLED_IMAGES = BASE_DIR / 'docs' / 'images'
+BUNDLED_MAX_SIZE = 192  # Bundled photos are downscaled to keep the run short
+
+MAPPINGS = ['linear', 'logarithmic', 'exponential', 'sigmoid', 'power', 'adaptive']
+GRID_SIZES = [None, 8, 16]
+INVERT_OPTIONS = [False, True]
+UPSCALE_FACTORS = [1, 2]
+
+def synthetic_images():
+    """Generate the deterministic synthetic part of the corpus."""
+    rng = np.random.default_rng(1234)
+    size = 96
+    ramp = np.linspace(0, 255, size, dtype=np.float64)
+    yy, xx = np.mgrid[0:size, 0:size]
+
+    images = {
+        'gradient_h': Image.fromarray(np.tile(ramp, (size, 1)).astype(np.uint8), 'L'),
+        'gradient_radial': Image.fromarray(
+            (255 - np.clip(np.hypot(xx - size / 2, yy - size / 2) * 4, 0, 255)).astype(np.uint8), 'L'),
+        'checker': Image.fromarray((((xx // 12 + yy // 12) % 2) * 255).astype(np.uint8), 'L'),
+        'noise': Image.fromarray(rng.integers(0, 256, (size, size), dtype=np.uint8), 'L'),
+        'color_bands': Image.fromarray(np.stack([
+            np.tile(ramp, (size, 1)),
+            np.tile(ramp[:, None], (1, size)),
+            np.full((size, size), 128.0)
+        ], axis=2).astype(np.uint8), 'RGB'),
+        'odd_size_rgb': Image.fromarray(rng.integers(0, 256, (77, 131, 3), dtype=np.uint8), 'RGB'),
+    }
+
+    # Transparent areas must come out black
+    rgba = np.zeros((size, size, 4), dtype=np.uint8)
+    rgba[..., :3] = rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+    rgba[..., 3] = ((xx + yy) % 64 < 32) * 255
+    images['alpha_stripes'] = Image.fromarray(rgba, 'RGBA')
+
+    # Partial alpha exercises the exact compositing arithmetic
+    rgba = rgba.copy()
+    rgba[..., 3] = (xx * 255 // (size - 1)).astype(np.uint8)
+    images['alpha_gradient'] = Image.fromarray(rgba, 'RGBA')
+
+    # Other modes are resized by PIL in their own mode before conversion
+    indexed = Image.fromarray(((xx // 6 + yy // 8) % 16).astype(np.uint8), 'P')
+    indexed.putpalette(rng.integers(0, 256, 16 * 3, dtype=np.uint8).tolist())
+    images['palette_indexed'] = indexed
+    la = np.stack([np.tile(ramp, (size, 1)), ((xx + yy) % 48 * 255 // 47)], axis=2)
+    images['la_gradient'] = Image.fromarray(la.astype(np.uint8), 'LA')
+    return images
+
+def bundled_images():
+    """Load the images shipped in docs/images, downscaled deterministically."""
+    images = {}
+    for path in sorted(BUNDLED_IMAGES.glob('*')):
+        if path.suffix.lower() not in ('.jpg', '.jpeg', '.png'):
+            continue
+        with Image.open(path) as img:
+            img = img.convert('RGB')
+            img.thumbnail((BUNDLED_MAX_SIZE, BUNDLED_MAX_SIZE), Image.Resampling.LANCZOS)
+            images[f"docs_{path.stem}"] = img.copy()
+    return images
+
+def build_cases():
+    """Return (case_id, image_name, params, reference_id) for every combination.
+
+    Invert does not change the circles and only negates the pixels, so
+    inverted cases are checked against the reference of their normal case.
+    """
+    cases = []
+    image_names = sorted(list(synthetic_images()) + list(bundled_images()))
+    for name in image_names:
+        for grid_size, invert, upscale in itertools.product(GRID_SIZES, INVERT_OPTIONS, UPSCALE_FACTORS):
+            prefix, suffix = f"g{grid_size or 'auto'}_", f"_x{upscale}"
+            variant = f"{prefix}{'inv' if invert else 'norm'}{suffix}"
+            reference = f"{prefix}norm{suffix}"
+            for mapping in MAPPINGS:
+                params = {'mode': 'grayscale', 'mapping': mapping, 'grid_size': grid_size,
+                          'invert': invert, 'upscale_factor': upscale}
+                cases.append((f"{name}_gray_{mapping}_{variant}", name, params,
+                              f"{name}_gray_{mapping}_{reference}"))
+            params = {'mode': 'color', 'mapping': None, 'grid_size': grid_size,
+                      'invert': invert, 'upscale_factor': upscale}
+            cases.append((f"{name}_color_{variant}", name, params, f"{name}_color_{reference}"))
+    return cases
+
+def create_processor(params):
+    """Create a processor for a case."""
+    if params['mode'] == 'color':
+        return StixisColorProcessor(num_colors=5, grid_size=params['grid_size'],
+                                    invert=params['invert'],
+                                    upscale_factor=params['upscale_factor'])
+    return StixisProcessor(num_colors=5, grid_size=params['grid_size'],
+                           invert=params['invert'],
+                           brightness_mapping=params['mapping'],
+                           upscale_factor=params['upscale_factor'])
+
+def run_case(image, params):
+    """Run a case, returning the rendered image, its circles and the scene render."""
+    # Palette extraction subsamples randomly; pin the seed for reproducibility
+    np.random.seed(0)
+    output = create_processor(params).process(image.copy())
+    np.random.seed(0)
+    scene = create_processor(params).compute_scene(image.copy())
+    return output, scene.circles, scene.render()
+
+def pixel_diff(expected, actual):
+    """Describe the pixel differences between two images, or None if identical."""
+    if expected.mode != actual.mode:
+        return f"mode {expected.mode} != {actual.mode}"
+    if expected.size != actual.size:
+        return f"size {expected.size} != {actual.size}"
+
+    a = np.asarray(expected, dtype=np.int16)
+    b = np.asarray(actual, dtype=np.int16)
+    diff = np.abs(a - b)
+    if diff.ndim == 3:
+        diff = diff.max(axis=2)
+    changed = np.argwhere(diff > 0)
+    if len(changed) == 0:
+        return None
+
+    (y0, x0), (y1, x1) = changed.min(axis=0), changed.max(axis=0)
+    first = [f"({x},{y})" for y, x in changed[:5]]
+    return (f"{len(changed)} pixels differ (max delta {diff.max()}), "
+            f"bbox x={x0}..{x1} y={y0}..{y1}, first at {', '.join(first)}")
+
+def circle_diff(expected, actual, limit=10):
+    """Describe the cell-level differences between two circle lists."""
+    expected = {(c[0], c[1]): c for c in expected}
+    actual = {(c[0], c[1]): c for c in actual}
+    lines = []
+    for key in sorted(expected.keys() | actual.keys()):
+        e, a = expected.get(key), actual.get(key)
+        if e == a:
+            continue
+        if e is None:
+            lines.append(f"extra circle at {key}: r={a[2]} color={a[3]}")
+        elif a is None:
+            lines.append(f"missing circle at {key}: r={e[2]} color={e[3]}")
+        else:
+            lines.append(f"circle at {key}: r={e[2]}->{a[2]} color={e[3]}->{a[3]}")
+    if len(lines) > limit:
+        lines = lines[:limit] + [f"... {len(lines) - limit} more"]
+    return lines
+
+def load_circles(path):
+    with open(path) as f:
+        return [(x, y, r, tuple(c) if isinstance(c, list) else c) for x, y, r, c in json.load(f)]
+
+def save_circles(path, circles):
+    with open(path, 'w') as f:
+        json.dump([[x, y, r, list(c) if isinstance(c, tuple) else c] for x, y, r, c in circles],
+                  f, separators=(',', ':'))
+
+def main():
+    parser = argparse.ArgumentParser(description='Stixis - Golden output equivalence check')
+    parser.add_argument('--update', action='store_true',
+                        help='Record the current outputs as the new references')
+    parser.add_argument('--filter', type=str, default='',
+                        help='Only run cases whose id contains this string')
+    parser.add_argument('--golden-dir', type=str, default=str(GOLDEN_DIR),
+                        help='Directory holding the reference outputs')
+    parser.add_argument('--list', action='store_true', help='List case ids and exit')
+    args = parser.parse_args()
+
+    cases = [c for c in build_cases() if args.filter in c[0]]
+    if args.list:
+        for case_id, _, _, _ in cases:
+            print(case_id)
+        return 0
+
+    golden_dir = Path(args.golden_dir)
+    golden_dir.mkdir(parents=True, exist_ok=True)
+    images = {**synthetic_images(), **bundled_images()}
+    failures = 0
+    missing = 0
+
+    for index, (case_id, image_name, params, reference_id) in enumerate(cases, 1):
+        if args.update and case_id != reference_id:
+            continue  # Inverted cases share the reference of their normal case
+
+        output, circles, scene_render = run_case(images[image_name], params)
+        png_path = golden_dir / f"{reference_id}.png"
+        circles_path = golden_dir / f"{reference_id}.json"
+
+        if args.update:
+            output.save(png_path, format='PNG', optimize=False)
+            save_circles(circles_path, circles)
+            print(f"[{index}/{len(cases)}] recorded {case_id}")
+            continue
+
+        if not png_path.exists() or not circles_path.exists():
+            missing += 1
+            print(f"[{index}/{len(cases)}] MISSING {case_id} (run with --update)")
+            continue
+
+        with Image.open(png_path) as reference:
+            reference.load()
+            if params['invert']:
+                reference = ImageOps.invert(reference)
+            problems = []
+            process_diff = pixel_diff(reference, output)
+            if process_diff:
+                problems.append(f"process(): {process_diff}")
+            render_diff = pixel_diff(reference, scene_render)
+            if render_diff:
+                problems.append(f"CircleScene.render(): {render_diff}")
+        problems += [f"circles: {line}" for line in circle_diff(load_circles(circles_path), circles)]
+
+        if problems:
+            failures += 1
+            print(f"[{index}/{len(cases)}] FAIL {case_id}")
+            for problem in problems:
+                print(f"    {problem}")
+        else:
+            print(f"[{index}/{len(cases)}] ok {case_id}")
+
+    if not args.update:
+        print(f"\n{len(cases) - failures - missing} passed, {failures} failed, {missing} missing")
+    return 1 if failures or missing else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
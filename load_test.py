@@ -0,0 +1,405 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+import numpy as np
+from PIL import Image
+
+BASE_DIR = Path(__file__).resolve().parent
+UPLOAD_FOLDER = BASE_DIR / 'uploads'
+
+def synthetic_upload(size, seed):
+    """Create a JPEG upload with photo-like structure (gradients plus noise)."""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:size, 0:size] / size
+    channels = [np.sin(xx * rng.uniform(2, 8) + yy * rng.uniform(2, 8)) for _ in range(3)]
+    pixels = (np.stack(channels, axis=2) * 100 + 128 + rng.normal(0, 20, (size, size, 3)))
+    buffer = BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), 'RGB').save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+def encode_multipart(fields, file_name, file_data):
+    """Encode form fields and one file as multipart/form-data."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; '
+                 f'filename="{file_name}"\r\nContent-Type: image/jpeg\r\n\r\n'.encode())
+    parts.append(file_data)
+    parts.append(f'\r\n--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(np.ceil(pct / 100 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+def process_tree_rss(pid):
+    """Return {pid: rss_bytes} for a process and all its descendants (Linux)."""
+    rss = {}
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        rss[current] = int(line.split()[1]) * 1024
+                        break
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children') as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            continue
+    return rss
+
+class ServerProcess:
+    """Run the app locally under the Flask development server or gunicorn."""
+
+    def __init__(self, server='flask', workers=2, port=None):
+        self.server = server
+        self.workers = workers
+        self.port = port or self._free_port()
+        self.process = None
+
+    @staticmethod
+    def _free_port():
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            return s.getsockname()[1]
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.port}'
+
+    def start(self, timeout=60):
+        if self.server == 'gunicorn':
+            command = [sys.executable, '-m', 'gunicorn', '-w', str(self.workers),
+                       '-b', f'127.0.0.1:{self.port}', '--timeout', '600', 'wsgi:app']
+        else:
+            command = [sys.executable, '-m', 'flask', 'run', '--with-threads',
+                       '--host', '127.0.0.1', '--port', str(self.port)]
+        env = dict(os.environ, FLASK_APP='wsgi.py')
+        self.process = subprocess.Popen(command, cwd=BASE_DIR, env=env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{self.server} exited with code {self.process.returncode}")
+            try:
+                urllib.request.urlopen(self.url + '/', timeout=1).read()
+                return
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                time.sleep(0.25)
+        self.stop()
+        raise RuntimeError(f"{self.server} did not start within {timeout}s")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+class LoadTest:
+    """Replay a mix of synthetic uploads and record per-request results."""
+
+    def __init__(self, url, mix, concurrency=4, rate=None, duration=30.0,
+                 max_requests=None, output_format='png', timeout=600, seed=0,
+                 reuse_names=False):
+        self.url = url.rstrip('/')
+        self.mix = mix
+        self.concurrency = concurrency
+        self.rate = rate
+        self.duration = duration
+        self.max_requests = max_requests
+        self.output_format = output_format
+        self.timeout = timeout
+        # The server keeps processed_<upload name>.png, so a server we cannot
+        # clean up gets a fixed name per case and in-flight slot
+        self.reuse_names = reuse_names
+        self._names_in_use = {}
+        self.results = []
+        self.timeline = []
+        self._lock = threading.Lock()
+        self._issued = itertools.count()
+        self._random = random.Random(seed)
+        self._uploads = {}
+        for size in sorted({case['size'] for case in mix}):
+            self._uploads[size] = synthetic_upload(size, seed + size)
+
+    def _next_case(self):
+        """Return the next request index and case, or None when done."""
+        with self._lock:
+            index = next(self._issued)
+            if self.max_requests is not None and index >= self.max_requests:
+                return None
+            return index, self._random.choice(self.mix)
+
+    def _acquire_name(self, index, case):
+        """Return an upload name no other in-flight request is using."""
+        if not self.reuse_names:
+            return f'load_{index}.jpg', None
+        key = f"{case['mode']}_{case['size']}px_x{case['upscale']}"
+        with self._lock:
+            in_use = self._names_in_use.setdefault(key, set())
+            slot = next(s for s in itertools.count() if s not in in_use)
+            in_use.add(slot)
+        return f'load_{key}_{slot}.jpg', (key, slot)
+
+    def _release_name(self, claim):
+        if claim:
+            key, slot = claim
+            with self._lock:
+                self._names_in_use[key].discard(slot)
+
+    def _send(self, index, case, scheduled):
+        fields = {
+            'num_colors': 5,
+            'processor_mode': case['mode'],
+            'upscale_factor': case['upscale'],
+            'use_smoothing': 'true',
+            'enhance_contrast': 'true',
+            'output_format': self.output_format,
+        }
+        file_name, claim = self._acquire_name(index, case)
+        body, content_type = encode_multipart(fields, file_name, self._uploads[case['size']])
+        request = urllib.request.Request(self.url + '/process', data=body, method='POST',
+                                         headers={'Content-Type': content_type})
+        started = time.time()
+        status, error, response_bytes = None, None, 0
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                status = response.status
+                response_bytes = len(response.read())
+        except urllib.error.HTTPError as e:
+            status, error = e.code, f"HTTP {e.code}"
+        except Exception as e:
+            error = type(e).__name__
+        finally:
+            self._release_name(claim)
+        finished = time.time()
+
+        with self._lock:
+            self.results.append({
+                'case': f"{case['mode']}_{case['size']}px_x{case['upscale']}",
+                'status': status,
+                'error': error,
+                # Measured from the scheduled send time, so client-side delays count
+                'latency': finished - scheduled,
+                'queue_delay': started - scheduled,
+                'response_bytes': response_bytes,
+                'finished_at': finished,
+            })
+
+    def _closed_loop(self, deadline):
+        """Each worker sends its next request as soon as the previous one finishes."""
+        def worker():
+            while time.time() < deadline:
+                next_case = self._next_case()
+                if next_case is None:
+                    return
+                self._send(*next_case, time.time())
+
+        threads = [threading.Thread(target=worker) for _ in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def _open_loop(self, deadline):
+        """Send requests at a fixed arrival rate regardless of response times."""
+        # Enough threads for every request that can be in flight before timing
+        # out, so slow responses never delay the next arrival
+        pool = ThreadPoolExecutor(max_workers=int(self.rate * (self.timeout + 1)) + 1)
+
+        def schedule():
+            next_time = time.time()
+            while next_time < deadline:
+                next_case = self._next_case()
+                if next_case is None:
+                    break
+                pool.submit(self._send, *next_case, next_time)
+                next_time += 1.0 / self.rate
+                time.sleep(max(0.0, next_time - time.time()))
+            pool.shutdown(wait=True)
+
+        thread = threading.Thread(target=schedule)
+        thread.start()
+        return [thread]
+
+    def run(self, server_pid=None, sample_interval=1.0):
+        started = time.time()
+        deadline = started + self.duration
+        threads = self._open_loop(deadline) if self.rate else self._closed_loop(deadline)
+
+        while any(thread.is_alive() for thread in threads):
+            with self._lock:
+                completed = len(self.results)
+                errors = sum(1 for r in self.results if r['error'])
+            sample = {'t': round(time.time() - started, 2), 'completed': completed, 'errors': errors}
+            if server_pid:
+                rss = process_tree_rss(server_pid)
+                sample['rss_total_mb'] = round(sum(rss.values()) / 2**20, 1)
+                sample['rss_per_process_mb'] = {str(pid): round(v / 2**20, 1) for pid, v in rss.items()}
+            self.timeline.append(sample)
+            time.sleep(sample_interval)
+
+        self.elapsed = time.time() - started
+
+    def summary(self):
+        """Return throughput, latency percentiles and error rates, overall and per case."""
+        def summarize(results):
+            latencies = sorted(r['latency'] for r in results if not r['error'])
+            queue_delays = sorted(r['queue_delay'] for r in results)
+            errors = sum(1 for r in results if r['error'])
+            return {
+                'requests': len(results),
+                'errors': errors,
+                'error_rate': round(errors / len(results), 4) if results else 0,
+                'throughput_rps': round(len(results) / self.elapsed, 3) if self.elapsed else 0,
+                'success_rps': round((len(results) - errors) / self.elapsed, 3) if self.elapsed else 0,
+                'latency_p50': percentile(latencies, 50),
+                'latency_p95': percentile(latencies, 95),
+                'latency_p99': percentile(latencies, 99),
+                'latency_max': latencies[-1] if latencies else None,
+                'queue_delay_p95': percentile(queue_delays, 95),
+                'queue_delay_p99': percentile(queue_delays, 99),
+            }
+
+        cases = sorted({r['case'] for r in self.results})
+        error_kinds = {}
+        for r in self.results:
+            if r['error']:
+                error_kinds[r['error']] = error_kinds.get(r['error'], 0) + 1
+        peak_rss = max((s.get('rss_total_mb', 0) for s in self.timeline), default=None)
+        return {
+            'overall': summarize(self.results),
+            'by_case': {case: summarize([r for r in self.results if r['case'] == case]) for case in cases},
+            'errors_by_kind': error_kinds,
+            'peak_rss_mb': peak_rss,
+            'elapsed_seconds': round(self.elapsed, 2),
+        }
+
+def print_summary(summary, baseline=None):
+    """Print a summary table, with deltas against a baseline summary if given."""
+    def fmt(value):
+        if value is None:
+            return '-'
+        return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+    def delta(new, old):
+        if baseline is None or new is None or old is None or not old:
+            return ''
+        return f" ({(new - old) / old * 100:+.1f}%)"
+
+    rows = [('overall', summary['overall'])] + list(summary['by_case'].items())
+    old_rows = {}
+    if baseline:
+        old_rows = {'overall': baseline['overall'], **baseline['by_case']}
+
+    print(f"\n{'case':<28}{'reqs':>8}{'err%':>8}{'ok rps':>16}{'p50':>16}{'p95':>16}{'p99':>16}")
+    for name, row in rows:
+        old = old_rows.get(name, {})
+        print(f"{name:<28}{row['requests']:>8}{row['error_rate'] * 100:>7.1f}%"
+              f"{fmt(row['success_rps']) + delta(row['success_rps'], old.get('success_rps')):>16}"
+              f"{fmt(row['latency_p50']) + delta(row['latency_p50'], old.get('latency_p50')):>16}"
+              f"{fmt(row['latency_p95']) + delta(row['latency_p95'], old.get('latency_p95')):>16}"
+              f"{fmt(row['latency_p99']) + delta(row['latency_p99'], old.get('latency_p99')):>16}")
+    overall = summary['overall']
+    print(f"Total throughput (including errors): {fmt(overall['throughput_rps'])} rps")
+    print(f"Client queue delay p95/p99: {fmt(overall['queue_delay_p95'])}/{fmt(overall['queue_delay_p99'])} s")
+    if summary['errors_by_kind']:
+        print(f"Errors: {summary['errors_by_kind']}")
+    if summary['peak_rss_mb'] is not None:
+        print(f"Peak server RSS: {summary['peak_rss_mb']} MB")
+
+def parse_list(value, cast=str):
+    return [cast(v) for v in value.split(',') if v]
+
+def main():
+    parser = argparse.ArgumentParser(description='Stixis - Load test the web service')
+    parser.add_argument('--server', choices=['flask', 'gunicorn'], default='gunicorn',
+                        help='Server to start locally')
+    parser.add_argument('--url', type=str, help='Test an already running server instead')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker count')
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='Concurrent clients (ignored with --rate)')
+    parser.add_argument('--rate', type=float, help='Fixed arrival rate in requests per second')
+    parser.add_argument('--duration', type=float, default=30.0, help='Test duration in seconds')
+    parser.add_argument('--requests', type=int, help='Stop after this many requests')
+    parser.add_argument('--modes', type=str, default='grayscale,color',
+                        help='Comma-separated processing modes to mix')
+    parser.add_argument('--sizes', type=str, default='256,512,1024',
+                        help='Comma-separated upload sizes in pixels')
+    parser.add_argument('--upscale', type=str, default='1,2',
+                        help='Comma-separated upscale factors')
+    parser.add_argument('--output-format', choices=['png', 'scene', 'scene_json'], default='png',
+                        help='Response format requested from /process')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the request mix')
+    parser.add_argument('--output', type=str, help='Write results as JSON')
+    parser.add_argument('--compare', type=str, help='Baseline results JSON to compare against')
+    args = parser.parse_args()
+
+    mix = [{'mode': mode, 'size': size, 'upscale': upscale}
+           for mode, size, upscale in itertools.product(
+               parse_list(args.modes), parse_list(args.sizes, int), parse_list(args.upscale, int))]
+
+    server = None
+    if args.url:
+        url = args.url
+    else:
+        server = ServerProcess(args.server, workers=args.workers)
+        print(f"Starting {args.server} on {server.url}")
+        server.start()
+        url = server.url
+
+    load_test = LoadTest(url, mix, concurrency=args.concurrency, rate=args.rate,
+                         duration=args.duration, max_requests=args.requests,
+                         output_format=args.output_format, seed=args.seed,
+                         reuse_names=server is None)
+    mode = f"{args.rate} req/s" if args.rate else f"concurrency {args.concurrency}"
+    print(f"Running {len(mix)} request types at {mode} for up to {args.duration}s")
+    try:
+        load_test.run(server_pid=server.process.pid if server else None)
+    finally:
+        if server:
+            server.stop()
+            for path in UPLOAD_FOLDER.glob('processed_load_*'):
+                path.unlink()
+
+    summary = load_test.summary()
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['summary']
+    print_summary(summary, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'config': {**vars(args), 'mix': mix, 'started_at': time.time() - load_test.elapsed},
+                'summary': summary,
+                'timeline': load_test.timeline,
+                'requests': load_test.results,
+            }, f, indent=2)
+        print(f"Results saved to: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ from pathlib import Path
 from stixis_processor import StixisProcessor
 from stixis_color_processor import StixisColorProcessor
 from PIL import Image
+from tile_pyramid import TilePyramid
+from palette_store import load_palette
 
 def main():
     parser = argparse.ArgumentParser(description='Stixis - Circle Pattern Generator')
@@ -18,6 +20,8 @@ def main():
                       help='Processing mode (grayscale/color)')
     parser.add_argument('--palette-size', type=int, default=8,
                       help='Number of colors in palette (color mode only)')
+    parser.add_argument('--palette-file', type=str,
+                      help='Use a saved palette instead of extracting one (color mode only)')
     parser.add_argument('--mapping', choices=['linear', 'logarithmic', 'exponential', 
                                             'sigmoid', 'power', 'adaptive'],
                       default='linear', help='Brightness mapping mode')
@@ -25,6 +29,10 @@ def main():
                       help='Gamma value for power mapping')
     parser.add_argument('--upscale', type=int, choices=[1, 2, 4, 8], default=1,
                        help='Upscale factor for better quality (1x, 2x, 4x, 8x)')
+    parser.add_argument('--tiles', action='store_true',
+                       help='Write a DZI tile pyramid instead of a single image')
+    parser.add_argument('--tile-size', type=int, default=256,
+                       help='Tile size in pixels for --tiles output')
 
     args = parser.parse_args()
 
@@ -51,6 +59,15 @@ def main():
         print(f"Error loading image: {e}")
         return
 
+    # Load a saved palette if provided
+    palette = None
+    if args.palette_file:
+        try:
+            palette = load_palette(args.palette_file)
+        except Exception as e:
+            print(f"Error loading palette: {e}")
+            return
+
     # Create appropriate processor
     if args.mode == 'color':
         processor = StixisColorProcessor(
@@ -60,7 +77,9 @@ def main():
             smoothing_sigma=args.sigma,
             enhance_contrast=args.contrast,
             color_palette_size=args.palette_size,
-            invert=args.invert
+            invert=args.invert,
+            upscale_factor=args.upscale,
+            palette=palette
         )
     else:
         processor = StixisProcessor(
@@ -71,9 +90,21 @@ def main():
             enhance_contrast=args.contrast,
             invert=args.invert,
             brightness_mapping=args.mapping,
-            gamma=args.gamma
+            gamma=args.gamma,
+            upscale_factor=args.upscale
         )
 
+    # Write tile pyramid next to the output path
+    if args.tiles:
+        try:
+            scene = processor.compute_scene(input_image)
+            pyramid = TilePyramid(scene, tile_size=args.tile_size)
+            dzi_path = pyramid.write(output_path.parent, output_path.stem)
+            print(f"Tile pyramid saved to: {dzi_path}")
+        except Exception as e:
+            print(f"Error processing image: {e}")
+        return
+
     # Process image
     try:
         output_image = processor.process(input_image)
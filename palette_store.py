@@ -0,0 +1,99 @@
+import argparse
+import hashlib
+import json
+import re
+from pathlib import Path
+import numpy as np
+from PIL import Image
+from array_utils import image_to_array
+from stixis_color_processor import StixisColorProcessor
+
+PALETTE_ID_PATTERN = re.compile(r'^[0-9a-f]{16}$')
+
+def extract_palette(images, palette_size=8):
+    """Extract one shared palette from one or more reference images.
+
+    Each image contributes the same number of sampled pixels, so a large
+    reference does not drown out the others.
+    """
+    processor = StixisColorProcessor(color_palette_size=palette_size)
+    if len(images) == 1:
+        return processor.get_color_palette(image_to_array(images[0], 'RGB'))
+
+    per_image = max(1, 10000 // len(images))
+    samples = []
+    for image in images:
+        rgb = np.asarray(image.convert('RGB')).reshape(-1, 3)
+        if len(rgb) > per_image:
+            rgb = rgb[np.random.choice(len(rgb), per_image, replace=False)]
+        samples.append(rgb)
+    combined = np.concatenate(samples)[:, np.newaxis, :]
+    return processor.get_color_palette(combined)
+
+def save_palette(palette, file_path):
+    """Save a palette as a small JSON file."""
+    with open(file_path, 'w') as f:
+        json.dump({'palette_size': len(palette),
+                   'colors': [[int(c) for c in color] for color in palette]}, f)
+    return Path(file_path)
+
+def load_palette(file_path):
+    """Load a palette saved with save_palette()."""
+    with open(file_path) as f:
+        data = json.load(f)
+    colors = data.get('colors') if isinstance(data, dict) else data
+    palette = np.array(colors, dtype=int)
+    if palette.ndim != 2 or palette.shape[1] != 3 or len(palette) == 0:
+        raise ValueError("Palette must be a non-empty list of [r, g, b] colors")
+    if palette.min() < 0 or palette.max() > 255:
+        raise ValueError("Palette colors must be in the range 0-255")
+    return palette
+
+class PaletteStore:
+    """Directory of saved palettes addressed by a content-derived id."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def palette_id(palette):
+        """Return the id for a palette, stable across saves."""
+        data = np.asarray(palette, dtype=np.int64).tobytes()
+        return hashlib.sha1(data).hexdigest()[:16]
+
+    def _path(self, palette_id):
+        if not PALETTE_ID_PATTERN.match(palette_id):
+            raise ValueError("Invalid palette id")
+        return self.directory / f"{palette_id}.json"
+
+    def add(self, palette):
+        """Store a palette and return its id."""
+        palette_id = self.palette_id(palette)
+        path = self._path(palette_id)
+        if not path.exists():
+            save_palette(palette, path)
+        return palette_id
+
+    def get(self, palette_id):
+        """Return a stored palette, or None if it does not exist."""
+        path = self._path(palette_id)
+        if not path.exists():
+            return None
+        return load_palette(path)
+
+def main():
+    parser = argparse.ArgumentParser(description='Stixis - Extract a reusable color palette')
+    parser.add_argument('images', nargs='+', help='Reference image paths')
+    parser.add_argument('--output', type=str, required=True, help='Palette file to write')
+    parser.add_argument('--palette-size', type=int, default=8,
+                        help='Number of colors in palette')
+    args = parser.parse_args()
+
+    images = [Image.open(path) for path in args.images]
+    palette = extract_palette(images, args.palette_size)
+    save_palette(palette, args.output)
+    print(f"Palette with {len(palette)} colors saved to: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+from stixis_processor import StixisProcessor
+from stixis_color_processor import StixisColorProcessor
+
+def create_processor(params):
+    """Create a processor for the given parameters."""
+    if params['processor_mode'] == 'color':
+        return StixisColorProcessor(
+            num_colors=params['num_colors'],
+            grid_size=params['grid_size'],
+            smoothing=params['smoothing'],
+            smoothing_sigma=params['smoothing_sigma'],
+            enhance_contrast=params['enhance_contrast'],
+            color_palette_size=params['color_palette_size'],
+            invert=params['invert'],
+            upscale_factor=params['upscale_factor'],
+            palette=params.get('palette')
+        )
+    return StixisProcessor(
+        num_colors=params['num_colors'],
+        grid_size=params['grid_size'],
+        smoothing=params['smoothing'],
+        smoothing_sigma=params['smoothing_sigma'],
+        enhance_contrast=params['enhance_contrast'],
+        invert=params['invert'],
+        brightness_mapping=params['brightness_mapping'],
+        gamma=params['gamma'],
+        upscale_factor=params['upscale_factor']
+    )
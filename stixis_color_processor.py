@@ -1,15 +1,29 @@
-from PIL import Image, ImageDraw, ImageOps
+from PIL import Image
 import numpy as np
 from scipy.ndimage import gaussian_filter
 from skimage import exposure
-from collections import Counter
+from collections import Counter, OrderedDict
+import hashlib
+import threading
+from stixis_scene import CircleScene
+from array_utils import (validate_array, image_to_array, to_gray, composite_on_black,
+                         resize_array, prepare_output, render_circles)
 
 class StixisColorProcessor:
+    # Extracted palettes shared by all instances, keyed by image hash and size
+    PALETTE_CACHE_SIZE = 32
+    _palette_cache = OrderedDict()
+    _palette_cache_lock = threading.Lock()
+
     def __init__(self, num_colors=5, grid_size=None, smoothing=False, 
                  smoothing_sigma=1.0, darkness_threshold=0.1,
                  enhance_contrast=False, contrast_percentile=(2, 98),
-                 color_palette_size=8, invert=False, upscale_factor=1):
-        """Initialize the Stixis color processor."""
+                 color_palette_size=8, invert=False, upscale_factor=1,
+                 palette=None):
+        """Initialize the Stixis color processor.
+
+        A fixed palette (list of RGB colors) skips per-image extraction.
+        """
         self.num_colors = num_colors
         self.grid_size = grid_size
         self.smoothing = smoothing
@@ -20,6 +34,7 @@ class StixisColorProcessor:
         self.color_palette_size = color_palette_size
         self.invert = invert
         self.upscale_factor = upscale_factor
+        self.palette = np.array(palette, dtype=int) if palette is not None else None
         self.color_cache = {}
         
     def _median_cut(self, pixels, depth):
@@ -43,16 +58,16 @@ class StixisColorProcessor:
             self._median_cut(pixels[median:], depth - 1)
         ])
     
-    def _extract_color_palette(self, image):
+    def _extract_color_palette(self, rgb_array):
         """Extract dominant colors using median cut algorithm."""
-        # Convert image to RGB array and reshape
-        img_array = np.array(image.convert('RGB'))
-        pixels = img_array.reshape(-1, 3)
+        height, width = rgb_array.shape[:2]
         
-        # Subsample pixels for faster processing
-        if len(pixels) > 10000:
-            indices = np.random.choice(len(pixels), 10000, replace=False)
-            pixels = pixels[indices]
+        # Subsample pixels for faster processing, gathering only the samples
+        if height * width > 10000:
+            indices = np.random.choice(height * width, 10000, replace=False)
+            pixels = rgb_array[indices // width, indices % width]
+        else:
+            pixels = rgb_array.reshape(-1, 3)
         
         # Calculate depth needed for desired palette size
         depth = int(np.log2(self.color_palette_size))
@@ -67,6 +82,27 @@ class StixisColorProcessor:
         sorted_colors = [palette[i] for i, _ in color_counts.most_common()]
         return np.array(sorted_colors)
     
+    def get_color_palette(self, pixels):
+        """Return the palette for an image array, extracting it once per image."""
+        validate_array(pixels)
+        digest = hashlib.blake2b(np.ascontiguousarray(pixels).data, digest_size=16).digest()
+        cache_key = (digest, pixels.shape, self.color_palette_size)
+        
+        with self._palette_cache_lock:
+            palette = self._palette_cache.get(cache_key)
+            if palette is not None:
+                self._palette_cache.move_to_end(cache_key)
+                return palette
+        
+        palette = self._extract_color_palette(self._rgb_view(pixels))
+        palette.setflags(write=False)  # Shared between processors
+        
+        with self._palette_cache_lock:
+            self._palette_cache[cache_key] = palette
+            while len(self._palette_cache) > self.PALETTE_CACHE_SIZE:
+                self._palette_cache.popitem(last=False)
+        return palette
+    
     def _find_nearest_color(self, pixel_color, palette):
         """Find the nearest color in the palette using vectorized operations."""
         cache_key = (*pixel_color, palette.tobytes())
@@ -79,24 +115,11 @@ class StixisColorProcessor:
         self.color_cache[cache_key] = nearest_color
         return nearest_color
     
-    def _draw_circle(self, draw, center_x, center_y, size, color):
-        """Draw a colored circle without any artifacts."""
-        if size <= 0:
-            return
-            
-        radius = size // 2
-        if radius == 0:
-            draw.point((center_x, center_y), fill=color)
-            return
-
-        # Draw filled circle using optimized scanline algorithm
-        for y in range(-radius, radius + 1):
-            x_val = int((radius * radius - y * y) ** 0.5)
-            x_start = center_x - x_val
-            x_end = center_x + x_val + 1
-            # Draw horizontal line
-            for x in range(x_start, x_end):
-                draw.point((x, center_y + y), fill=color)
+    def _rgb_view(self, pixels):
+        """Return an RGB view of an image array without copying it."""
+        if pixels.ndim == 2:
+            return np.broadcast_to(pixels[..., np.newaxis], pixels.shape + (3,))
+        return pixels[..., :3]
 
     def save_image(self, image, file_path):
         """Save the processed image as a PNG file."""
@@ -104,10 +127,85 @@ class StixisColorProcessor:
 
     def process(self, image):
         """Process the image and create colored circle pattern effect."""
-        original_width, original_height = image.size
+        return Image.fromarray(self.render_array(self.compute_circles(image)), 'RGB')
+
+    def process_array(self, pixels, out=None, return_circles=False):
+        """Process a uint8 HxW, HxWx3 or HxWx4 array.
+
+        The input is never modified or copied up front, so read-only and
+        memory-mapped arrays are fine. The result is drawn into `out` when
+        given (uint8, shape (height, width, 3)). With return_circles=True the
+        (x, y, radius, color) list is returned instead of a raster.
+        """
+        circles = self.compute_circles_array(pixels)
+        if return_circles:
+            return circles
+        return self.render_array(circles, out)
+
+    def render_array(self, circles, out=None):
+        """Render circles computed by this processor into a uint8 array."""
+        output = prepare_output(out, (self.height, self.width, 3))
+        render_circles(output, circles)
         
-        # Extract color palette BEFORE upscaling
-        color_palette = self._extract_color_palette(image)
+        # Invert the final image if requested
+        if self.invert:
+            np.subtract(255, output, out=output)
+        
+        return output
+
+    def compute_scene(self, image):
+        """Process the image into a CircleScene instead of a raster."""
+        circles = self.compute_circles(image)
+        return CircleScene(self.width, self.height, circles, mode='RGB', invert=self.invert)
+
+    def compute_circles(self, image):
+        """Compute the circles for the image as (x, y, radius, color) tuples."""
+        pixels = image_to_array(image, 'RGB')
+        color_palette = self._palette_for(pixels)
+        return self.circles_from_stats(self.compute_image_stats(image, pixels), color_palette)
+
+    def compute_circles_array(self, pixels):
+        """Compute the circles for an image array as (x, y, radius, color) tuples."""
+        validate_array(pixels)
+        color_palette = self._palette_for(pixels)
+        return self.circles_from_stats(self.compute_cell_stats(pixels), color_palette)
+
+    def _palette_for(self, pixels):
+        """Return the fixed palette, or the one extracted from the image array."""
+        # Extract color palette BEFORE upscaling (alpha is ignored here)
+        if self.palette is not None:
+            return self.palette
+        return self.get_color_palette(pixels)
+
+    def compute_image_stats(self, image, pixels=None):
+        """Compute cell statistics for a PIL image.
+
+        Modes other than L, RGB and RGBA are upscaled by PIL in their own
+        mode (nearest neighbour for P, premultiplied alpha for LA) and only
+        then converted, so they are not resampled through an RGB array.
+        pixels may be passed when the image has already been converted.
+        """
+        if pixels is None:
+            pixels = image_to_array(image, 'RGB')
+        if image.mode in ('L', 'RGB', 'RGBA') or self.upscale_factor == 1:
+            return self.compute_cell_stats(pixels)
+        
+        upscaled = image.resize(
+            (image.width * self.upscale_factor, image.height * self.upscale_factor),
+            Image.Resampling.BILINEAR
+        )
+        return self.compute_cell_stats(pixels, upscaled=np.asarray(upscaled.convert('RGB')))
+
+    def compute_cell_stats(self, pixels, upscaled=None):
+        """Compute per-cell brightness and average color for an image array.
+
+        The statistics only depend on upscaling and the grid, so variants
+        differing in palette, threshold or invert can share them. upscaled
+        replaces the internal resize of pixels when the caller has already
+        upscaled the image (see compute_image_stats()).
+        """
+        validate_array(pixels)
+        original_height, original_width = pixels.shape[:2]
         
         # Calculate base grid size before upscaling
         if self.grid_size is None:
@@ -119,66 +217,68 @@ class StixisColorProcessor:
         if self.upscale_factor > 1:
             new_width = original_width * self.upscale_factor
             new_height = original_height * self.upscale_factor
-            image = image.resize((new_width, new_height), Image.Resampling.BILINEAR)
+            if upscaled is None:
+                pixels = resize_array(pixels, new_width, new_height, Image.Resampling.BILINEAR)
+            else:
+                pixels = upscaled
             self.width, self.height = new_width, new_height
-            self.grid_size = base_grid_size * self.upscale_factor
+            cell_size = base_grid_size * self.upscale_factor
         else:
             self.width, self.height = original_width, original_height
-            self.grid_size = base_grid_size
+            cell_size = base_grid_size
         
         # Handle transparency
-        if image.mode == 'RGBA':
-            background = Image.new('RGB', image.size, (0, 0, 0))
-            image = Image.alpha_composite(background.convert('RGBA'), image)
-        
-        # Convert to arrays and process in batches
-        rgb_array = np.array(image.convert('RGB'))
-        gray_array = np.array(image.convert('L'))
+        if pixels.ndim == 3 and pixels.shape[2] == 4:
+            pixels = composite_on_black(pixels)
         
-        # Create output image
-        output = Image.new('RGB', (self.width, self.height), (0, 0, 0))
-        draw = ImageDraw.Draw(output)
+        rgb_array = self._rgb_view(pixels)
+        gray_array = to_gray(pixels)
         
         # Calculate grid positions
-        y_positions = range(0, self.height, self.grid_size)
-        x_positions = range(0, self.width, self.grid_size)
+        y_positions = range(0, self.height, cell_size)
+        x_positions = range(0, self.width, cell_size)
         
+        cells = []
         # Process grid cells in batches
         for y in y_positions:
             for x in x_positions:
                 # Get cell data
-                gray_cell = gray_array[y:min(y+self.grid_size, self.height), 
-                                    x:min(x+self.grid_size, self.width)]
-                rgb_cell = rgb_array[y:min(y+self.grid_size, self.height), 
-                                   x:min(x+self.grid_size, self.width)]
+                gray_cell = gray_array[y:min(y+cell_size, self.height), 
+                                    x:min(x+cell_size, self.width)]
+                rgb_cell = rgb_array[y:min(y+cell_size, self.height), 
+                                   x:min(x+cell_size, self.width)]
                 
                 if gray_cell.size > 0:
                     # Calculate brightness and color
                     avg_brightness = np.mean(gray_cell) / 255.0
                     avg_color = tuple(np.mean(rgb_cell, axis=(0, 1)).astype(int))
-                    
-                    # Find nearest palette color
-                    circle_color = self._find_nearest_color(avg_color, color_palette)
-                    
-                    # Draw circle if bright enough
-                    if avg_brightness > self.darkness_threshold:
-                        circle_size = int(avg_brightness * self.grid_size * 0.8)
-                        if circle_size > 0:
-                            center_x = x + self.grid_size//2
-                            center_y = y + self.grid_size//2
-                            self._draw_circle(
-                                draw, 
-                                center_x, 
-                                center_y, 
-                                circle_size, 
-                                circle_color
-                            )
+                    cells.append((x, y, avg_brightness, avg_color))
         
-        # Invert the final image if requested
-        if self.invert:
-            output = ImageOps.invert(output)
+        return {'width': self.width, 'height': self.height,
+                'cell_size': cell_size, 'cells': cells}
+
+    def circles_from_stats(self, stats, color_palette):
+        """Derive the circle list from statistics returned by compute_cell_stats()."""
+        self.width, self.height = stats['width'], stats['height']
+        cell_size = stats['cell_size']
+        
+        circles = []
+        for x, y, avg_brightness, avg_color in stats['cells']:
+            # Find nearest palette color
+            circle_color = self._find_nearest_color(avg_color, color_palette)
+            
+            # Keep circle if bright enough
+            if avg_brightness > self.darkness_threshold:
+                circle_size = int(avg_brightness * cell_size * 0.8)
+                if circle_size > 0:
+                    circles.append((
+                        x + cell_size//2,
+                        y + cell_size//2,
+                        circle_size // 2,
+                        tuple(int(c) for c in circle_color)
+                    ))
         
-        return output 
+        return circles
 
     def process_and_save(self, image, file_path):
         """Process the image and save the result as a PNG file."""
@@ -1,8 +1,11 @@
-from PIL import Image, ImageDraw, ImageOps
+from PIL import Image
 import numpy as np
 from scipy.ndimage import gaussian_filter
 from skimage import exposure
 from scipy.special import expit  # for sigmoid function
+from stixis_scene import CircleScene
+from array_utils import (validate_array, image_to_gray_array, to_gray, resize_array,
+                         prepare_output, render_circles)
 
 class StixisProcessor:
     BRIGHTNESS_MAPPINGS = {
@@ -34,6 +37,7 @@ class StixisProcessor:
         self.brightness_mapping = brightness_mapping
         self.gamma = gamma
         self.upscale_factor = upscale_factor
+        self._cell_size = None  # Grid cell size in pixels for the current image
         self._setup_brightness_mapping()
         print(f"StixisProcessor initialized with self.invert={self.invert}")  # Debug log
 
@@ -51,15 +55,56 @@ class StixisProcessor:
 
     def process(self, image):
         """Process the image and create circle filter effect."""
-        original_width, original_height = image.size
+        return Image.fromarray(self.process_array(image_to_gray_array(image)), 'L')
+
+    def process_array(self, pixels, out=None, return_circles=False):
+        """Process a uint8 HxW, HxWx3 or HxWx4 array.
+
+        The input is never modified or copied up front, so read-only and
+        memory-mapped arrays are fine. The result is drawn into `out` when
+        given (uint8, shape (height, width)). With return_circles=True the
+        (x, y, radius, color) list is returned instead of a raster.
+        """
+        circles = self.compute_circles_array(pixels)
+        if return_circles:
+            return circles
+        return self.render_array(circles, out)
+
+    def render_array(self, circles, out=None):
+        """Render circles computed by this processor into a uint8 array."""
+        output = prepare_output(out, (self.height, self.width))
+        render_circles(output, circles)
         
-        # Handle transparency by converting transparent pixels to black
-        if image.mode == 'RGBA':
-            background = Image.new('RGB', image.size, (0, 0, 0))
-            image = Image.alpha_composite(background.convert('RGBA'), image)
+        # Invert the final image if requested
+        if self.invert:
+            np.subtract(255, output, out=output)
         
-        # Convert to grayscale first
-        pixels = np.array(image.convert('L'))
+        return output
+
+    def compute_scene(self, image):
+        """Process the image into a CircleScene instead of a raster."""
+        circles = self.compute_circles(image)
+        return CircleScene(self.width, self.height, circles, mode='L', invert=self.invert)
+
+    def compute_circles(self, image):
+        """Compute the circles for the image as (x, y, radius, color) tuples."""
+        return self.compute_circles_array(image_to_gray_array(image))
+
+    def compute_circles_array(self, pixels):
+        """Compute the circles for an image array as (x, y, radius, color) tuples."""
+        return self.circles_from_stats(self.compute_cell_stats(pixels))
+
+    def compute_cell_stats(self, pixels):
+        """Compute per-cell brightness statistics for an image array.
+
+        The statistics only depend on preprocessing, upscaling and the grid,
+        so variants differing in mapping, threshold or invert can share them.
+        """
+        validate_array(pixels)
+        original_height, original_width = pixels.shape[:2]
+        
+        # Convert to grayscale first, transparent pixels become black
+        pixels = to_gray(pixels)
         
         # Apply preprocessing before upscaling
         pixels = self._preprocess_image(pixels)
@@ -72,51 +117,62 @@ class StixisProcessor:
         
         # Apply upscaling after preprocessing if requested
         if self.upscale_factor > 1:
-            # Convert preprocessed pixels back to image for high-quality upscaling
-            processed_image = Image.fromarray(pixels)
             new_width = original_width * self.upscale_factor
             new_height = original_height * self.upscale_factor
             # Use LANCZOS for better quality upscaling of preprocessed image
-            processed_image = processed_image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            pixels = np.array(processed_image)
+            pixels = resize_array(pixels, new_width, new_height, Image.Resampling.LANCZOS)
             self.width, self.height = new_width, new_height
-            self.grid_size = base_grid_size * self.upscale_factor
+            self._cell_size = base_grid_size * self.upscale_factor
         else:
             self.width, self.height = original_width, original_height
-            self.grid_size = base_grid_size
-        
-        # Create output image
-        output = Image.new('L', (self.width, self.height), 0)
-        draw = ImageDraw.Draw(output)
+            self._cell_size = base_grid_size
         
         print(f"Image dimensions: {self.width}x{self.height}")  # Debug
-        print(f"Grid size: {self.grid_size}")  # Debug
-        print(f"Number of divisions: {min(self.width, self.height) // self.grid_size}")  # Debug
+        print(f"Grid size: {self._cell_size}")  # Debug
+        print(f"Number of divisions: {min(self.width, self.height) // self._cell_size}")  # Debug
         
         # Create grid of cell positions
-        y_coords = np.arange(0, self.height, self.grid_size)
-        x_coords = np.arange(0, self.width, self.grid_size)
+        y_coords = np.arange(0, self.height, self._cell_size)
+        x_coords = np.arange(0, self.width, self._cell_size)
         
+        cells = []
         # Process cells in vectorized manner where possible
         for y in y_coords:
             for x in x_coords:
                 # Extract cell and neighborhood data
                 cell_data = self._get_cell_data(pixels, y, x)
                 if cell_data['valid']:
-                    circle_params = self._calculate_circle_params(cell_data)
-                    if circle_params['should_draw']:
-                        self._draw_optimized_circle(
-                            draw, 
-                            x + self.grid_size//2,
-                            y + self.grid_size//2,
-                            circle_params['size']
-                        )
-        
-        # Invert the final image if requested
-        if self.invert:
-            output = ImageOps.invert(output)
-        
-        return output
+                    cells.append((
+                        int(x), int(y),
+                        cell_data['avg_brightness'],
+                        cell_data['neighborhood_brightness'],
+                        cell_data['neighborhood_std']
+                    ))
+        
+        return {'width': self.width, 'height': self.height,
+                'cell_size': self._cell_size, 'cells': cells}
+
+    def circles_from_stats(self, stats):
+        """Derive the circle list from statistics returned by compute_cell_stats()."""
+        self.width, self.height = stats['width'], stats['height']
+        self._cell_size = stats['cell_size']
+        
+        circles = []
+        for x, y, avg_brightness, neighborhood_brightness, neighborhood_std in stats['cells']:
+            circle_params = self._calculate_circle_params({
+                'avg_brightness': avg_brightness,
+                'neighborhood_brightness': neighborhood_brightness,
+                'neighborhood_std': neighborhood_std
+            })
+            if circle_params['should_draw'] and circle_params['size'] > 0:
+                circles.append((
+                    x + self._cell_size//2,
+                    y + self._cell_size//2,
+                    circle_params['size'] // 2,
+                    255
+                ))
+        
+        return circles
 
     def _preprocess_image(self, pixels):
         """Optimized preprocessing of image data."""
@@ -136,18 +192,18 @@ class StixisProcessor:
 
     def _get_cell_data(self, pixels, y, x):
         """Efficiently get cell and neighborhood data."""
-        y_end = min(y + self.grid_size, self.height)
-        x_end = min(x + self.grid_size, self.width)
+        y_end = min(y + self._cell_size, self.height)
+        x_end = min(x + self._cell_size, self.width)
         cell = pixels[y:y_end, x:x_end]
         
         if cell.size == 0:
             return {'valid': False}
             
         # Calculate neighborhood bounds
-        y_start_n = max(0, y - self.grid_size)
-        y_end_n = min(self.height, y + 2 * self.grid_size)
-        x_start_n = max(0, x - self.grid_size)
-        x_end_n = min(self.width, x + 2 * self.grid_size)
+        y_start_n = max(0, y - self._cell_size)
+        y_end_n = min(self.height, y + 2 * self._cell_size)
+        x_start_n = max(0, x - self._cell_size)
+        x_end_n = min(self.width, x + 2 * self._cell_size)
         
         neighborhood = pixels[y_start_n:y_end_n, x_start_n:x_end_n]
         
@@ -184,28 +240,9 @@ class StixisProcessor:
         if mapped_brightness <= self.darkness_threshold:
             return {'should_draw': False, 'size': 0}
             
-        circle_size = int(mapped_brightness * self.grid_size * 0.8)
+        circle_size = int(mapped_brightness * self._cell_size * 0.8)
         return {'should_draw': True, 'size': circle_size}
 
-    def _draw_optimized_circle(self, draw, center_x, center_y, size):
-        """Draw a circle without any artifacts."""
-        if size <= 0:
-            return
-            
-        radius = size // 2
-        if radius == 0:
-            draw.point((center_x, center_y), fill=255)
-            return
-
-        # Draw filled circle using optimized scanline algorithm
-        for y in range(-radius, radius + 1):
-            x_val = int((radius * radius - y * y) ** 0.5)
-            x_start = center_x - x_val
-            x_end = center_x + x_val + 1
-            # Draw horizontal line
-            for x in range(x_start, x_end):
-                draw.point((x, center_y + y), fill=255)
-
     def _adaptive_mapping(self, brightness):
         """Optimized adaptive mapping."""
         if brightness < 0.2:
@@ -0,0 +1,212 @@
+import json
+import struct
+from pathlib import Path
+from PIL import Image, ImageDraw, ImageOps
+import numpy as np
+
+SCENE_MAGIC = b'STXS'
+SCENE_VERSION = 1
+# magic, version, mode (0=L, 1=RGB), invert, reserved, width, height, circle count
+SCENE_HEADER = struct.Struct('<4sBBBBIII')
+
+class CircleScene:
+    """Resolution-independent description of a processed image.
+
+    A scene is the list of circles a processor would draw, each stored as
+    (center_x, center_y, radius, color) in full-resolution pixel coordinates.
+    Rendering it at scale 1.0 reproduces the processor output exactly.
+    """
+
+    def __init__(self, width, height, circles, mode='L', invert=False):
+        self.width = int(width)
+        self.height = int(height)
+        self.mode = mode
+        self.invert = invert
+        self.circles = [self._normalize_circle(c) for c in circles]
+        self._geometry = None
+
+    def _normalize_circle(self, circle):
+        """Convert numpy scalars to plain ints so the scene is serializable."""
+        x, y, radius, color = circle
+        if isinstance(color, (tuple, list, np.ndarray)):
+            color = tuple(int(c) for c in color)
+        else:
+            color = int(color)
+        return (int(x), int(y), int(radius), color)
+
+    @property
+    def geometry(self):
+        """Circle centers and radii as an (N, 3) array, built on first use."""
+        if self._geometry is None:
+            if self.circles:
+                self._geometry = np.array([c[:3] for c in self.circles], dtype=np.int64)
+            else:
+                self._geometry = np.zeros((0, 3), dtype=np.int64)
+        return self._geometry
+
+    def scaled_size(self, scale):
+        """Return the (width, height) of the scene rendered at the given scale."""
+        return (max(1, int(np.ceil(self.width * scale))),
+                max(1, int(np.ceil(self.height * scale))))
+
+    def circles_in_box(self, left, top, right, bottom):
+        """Return indices of circles intersecting the full-resolution box."""
+        geometry = self.geometry
+        if len(geometry) == 0:
+            return np.zeros(0, dtype=np.int64)
+        x, y, r = geometry[:, 0], geometry[:, 1], geometry[:, 2]
+        mask = (x + r >= left) & (x - r < right) & (y + r >= top) & (y - r < bottom)
+        return np.nonzero(mask)[0]
+
+    def render_region(self, scale, left, top, width, height):
+        """Render a region of the scene at the given scale.
+
+        left/top/width/height are in scaled pixel coordinates. Circles are
+        drawn with the same scanline rule as the processors, so a region
+        rendered at scale 1.0 matches the corresponding crop of process().
+        """
+        background = 0 if self.mode == 'L' else (0, 0, 0)
+        output = Image.new(self.mode, (width, height), background)
+        draw = ImageDraw.Draw(output)
+
+        # Select only circles that can touch this region
+        margin = 1.0 / scale
+        indices = self.circles_in_box(
+            left / scale - margin, top / scale - margin,
+            (left + width) / scale + margin, (top + height) / scale + margin
+        )
+
+        for i in indices:
+            cx, cy, radius, color = self.circles[i]
+            if scale == 1:
+                self._draw_circle(draw, cx - left, cy - top, radius, color)
+            else:
+                self._draw_circle(
+                    draw,
+                    int(round(cx * scale)) - left,
+                    int(round(cy * scale)) - top,
+                    int(round(radius * scale)),
+                    color
+                )
+
+        if self.invert:
+            output = ImageOps.invert(output)
+        return output
+
+    def render(self, scale=1.0):
+        """Render the whole scene into a new image."""
+        width, height = self.scaled_size(scale)
+        return self.render_region(scale, 0, 0, width, height)
+
+    def _draw_circle(self, draw, center_x, center_y, radius, color):
+        """Draw a filled circle one scanline at a time."""
+        if radius == 0:
+            draw.point((center_x, center_y), fill=color)
+            return
+
+        for y in range(-radius, radius + 1):
+            x_val = int((radius * radius - y * y) ** 0.5)
+            draw.line(
+                [(center_x - x_val, center_y + y), (center_x + x_val, center_y + y)],
+                fill=color
+            )
+
+    def to_dict(self):
+        """Return a JSON-serializable representation of the scene."""
+        return {
+            'width': self.width,
+            'height': self.height,
+            'mode': self.mode,
+            'invert': self.invert,
+            'circles': [list(c[:3]) + [list(c[3]) if isinstance(c[3], tuple) else c[3]]
+                        for c in self.circles]
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a scene from the output of to_dict()."""
+        circles = [
+            (x, y, radius, tuple(color) if isinstance(color, list) else color)
+            for x, y, radius, color in data['circles']
+        ]
+        return cls(data['width'], data['height'], circles,
+                   mode=data.get('mode', 'L'), invert=data.get('invert', False))
+
+    def to_bytes(self):
+        """Encode the scene in the compact binary format.
+
+        After the 20-byte little-endian header come four arrays, each
+        holding one value per circle: x (uint32), y (uint32), radius
+        (uint16) and color (uint8, three per circle in RGB mode).
+        """
+        geometry = self.geometry
+        header = SCENE_HEADER.pack(
+            SCENE_MAGIC, SCENE_VERSION, 1 if self.mode == 'RGB' else 0,
+            1 if self.invert else 0, 0, self.width, self.height, len(self.circles)
+        )
+        colors = np.array([c[3] for c in self.circles], dtype=np.uint8)
+        return b''.join([
+            header,
+            geometry[:, 0].astype('<u4').tobytes(),
+            geometry[:, 1].astype('<u4').tobytes(),
+            geometry[:, 2].astype('<u2').tobytes(),
+            colors.tobytes()
+        ])
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Decode a scene produced by to_bytes()."""
+        if len(data) < SCENE_HEADER.size:
+            raise ValueError("Scene data is truncated")
+        magic, version, mode, invert, _, width, height, count = SCENE_HEADER.unpack_from(data)
+        if magic != SCENE_MAGIC or version != SCENE_VERSION:
+            raise ValueError("Unsupported scene format")
+        
+        channels = 3 if mode == 1 else 1
+        if len(data) != SCENE_HEADER.size + count * (4 + 4 + 2 + channels):
+            raise ValueError("Scene data is truncated")
+        
+        offset = SCENE_HEADER.size
+        x = np.frombuffer(data, dtype='<u4', count=count, offset=offset)
+        offset += count * 4
+        y = np.frombuffer(data, dtype='<u4', count=count, offset=offset)
+        offset += count * 4
+        radius = np.frombuffer(data, dtype='<u2', count=count, offset=offset)
+        offset += count * 2
+        colors = np.frombuffer(data, dtype=np.uint8, count=count * channels, offset=offset)
+        
+        if channels == 3:
+            colors = [tuple(c) for c in colors.reshape(-1, 3)]
+        circles = list(zip(x, y, radius, colors))
+        return cls(width, height, circles, mode='RGB' if mode == 1 else 'L', invert=bool(invert))
+
+    def to_compact_dict(self):
+        """Return a compact JSON representation with one flat array per field."""
+        geometry = self.geometry
+        colors = []
+        for c in self.circles:
+            colors.extend(c[3] if isinstance(c[3], tuple) else (c[3],))
+        return {
+            'format': 'stixis-scene',
+            'version': SCENE_VERSION,
+            'width': self.width,
+            'height': self.height,
+            'mode': self.mode,
+            'invert': self.invert,
+            'x': geometry[:, 0].tolist(),
+            'y': geometry[:, 1].tolist(),
+            'r': geometry[:, 2].tolist(),
+            'color': colors
+        }
+
+    def save(self, file_path):
+        """Save the scene as JSON."""
+        with open(file_path, 'w') as f:
+            json.dump(self.to_dict(), f, separators=(',', ':'))
+        return Path(file_path)
+
+    @classmethod
+    def load(cls, file_path):
+        """Load a scene saved with save()."""
+        with open(file_path) as f:
+            return cls.from_dict(json.load(f))
@@ -0,0 +1,101 @@
+import math
+from pathlib import Path
+from PIL import Image
+
+class TilePyramid:
+    """Deep Zoom (DZI) tile pyramid rendered lazily from a CircleScene.
+
+    Level max_level is the full-resolution render; every level below halves
+    the dimensions until the image fits in a single pixel. Tiles are drawn
+    directly from the circle list, so no full-resolution raster is ever built.
+    """
+
+    def __init__(self, scene, tile_size=256, overlap=0, supersample=4):
+        self.scene = scene
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.supersample = supersample
+        self.max_level = int(math.ceil(math.log2(max(scene.width, scene.height, 1))))
+
+    def level_scale(self, level):
+        """Return the scale factor of a level relative to full resolution."""
+        return 0.5 ** (self.max_level - level)
+
+    def level_size(self, level):
+        """Return the (width, height) of a level."""
+        scale = self.level_scale(level)
+        return (max(1, int(math.ceil(self.scene.width * scale))),
+                max(1, int(math.ceil(self.scene.height * scale))))
+
+    def tile_count(self, level):
+        """Return the number of (columns, rows) of tiles at a level."""
+        width, height = self.level_size(level)
+        return (int(math.ceil(width / self.tile_size)),
+                int(math.ceil(height / self.tile_size)))
+
+    def tile_bounds(self, level, col, row):
+        """Return the (left, top, right, bottom) pixel box of a tile."""
+        width, height = self.level_size(level)
+        left = max(0, col * self.tile_size - self.overlap)
+        top = max(0, row * self.tile_size - self.overlap)
+        right = min(width, (col + 1) * self.tile_size + self.overlap)
+        bottom = min(height, (row + 1) * self.tile_size + self.overlap)
+        return left, top, right, bottom
+
+    def is_valid_tile(self, level, col, row):
+        """Check whether a tile address exists in the pyramid."""
+        if not (0 <= level <= self.max_level):
+            return False
+        cols, rows = self.tile_count(level)
+        return 0 <= col < cols and 0 <= row < rows
+
+    def render_tile(self, level, col, row):
+        """Render a single tile.
+
+        Full-resolution tiles are drawn 1:1. Lower levels are drawn at a
+        higher resolution and box-filtered down so that sub-pixel circles
+        still contribute their average brightness instead of vanishing.
+        """
+        if not self.is_valid_tile(level, col, row):
+            raise ValueError(f"Tile {level}/{col}_{row} is out of range")
+
+        left, top, right, bottom = self.tile_bounds(level, col, row)
+        scale = self.level_scale(level)
+        factor = min(self.supersample, int(round(1 / scale)))
+        if factor <= 1:
+            return self.scene.render_region(scale, left, top, right - left, bottom - top)
+
+        tile = self.scene.render_region(
+            scale * factor,
+            left * factor, top * factor,
+            (right - left) * factor, (bottom - top) * factor
+        )
+        return tile.resize((right - left, bottom - top), Image.Resampling.BOX)
+
+    def dzi_xml(self, image_format='png'):
+        """Return the DZI descriptor for this pyramid."""
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+            f'Format="{image_format}" Overlap="{self.overlap}" TileSize="{self.tile_size}">'
+            f'<Size Width="{self.scene.width}" Height="{self.scene.height}"/>'
+            '</Image>\n'
+        )
+
+    def write(self, output_dir, name):
+        """Write the complete pyramid to disk as <name>.dzi and <name>_files/."""
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        dzi_path = output_dir / f"{name}.dzi"
+        dzi_path.write_text(self.dzi_xml())
+
+        tiles_dir = output_dir / f"{name}_files"
+        for level in range(self.max_level + 1):
+            level_dir = tiles_dir / str(level)
+            level_dir.mkdir(parents=True, exist_ok=True)
+            cols, rows = self.tile_count(level)
+            for col in range(cols):
+                for row in range(rows):
+                    tile = self.render_tile(level, col, row)
+                    tile.save(level_dir / f"{col}_{row}.png", format='PNG')
+        return dzi_path
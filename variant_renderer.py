@@ -0,0 +1,83 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from PIL import Image
+from array_utils import validate_array, image_to_array
+from processor_factory import create_processor
+
+def stats_key(params):
+    """Return the parameters that determine a variant's cell statistics.
+
+    Variants with the same key share one statistics pass; mapping, gamma,
+    palette and invert only affect the cheap circle derivation and render.
+    """
+    divisions = params['grid_size'] or params['num_colors']
+    if params['processor_mode'] == 'color':
+        return ('color', divisions, params['upscale_factor'])
+    return (
+        'grayscale', divisions, params['upscale_factor'],
+        params['smoothing'], params['smoothing_sigma'] if params['smoothing'] else None,
+        params['enhance_contrast']
+    )
+
+def render_variants(image, variants, max_workers=None, return_circles=False, png=False):
+    """Render several parameter variants of one image.
+
+    image may be a PIL image or a uint8 array and is decoded only once.
+    variants is a list of parameter dicts as accepted by create_processor().
+    Cell statistics are computed once per distinct stats_key() and shared,
+    then every variant is derived and rendered in parallel.
+
+    Returns (processor, result) pairs in variant order, where result is a
+    uint8 array, the circle list when return_circles is True, or PNG bytes
+    when png is True. PNG encoding releases the GIL, so it is done in the
+    same threads as rendering.
+    """
+    if isinstance(image, Image.Image):
+        pixels = image_to_array(image, 'RGB')
+    else:
+        pixels, image = image, None
+    validate_array(pixels)
+
+    processors = [create_processor(params) for params in variants]
+    keys = [stats_key(params) for params in variants]
+
+    # Palettes are extracted up front so variants share the cached result
+    palettes = [
+        (p.palette if p.palette is not None else p.get_color_palette(pixels))
+        if params['processor_mode'] == 'color' else None
+        for p, params in zip(processors, variants)
+    ]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # One statistics pass per distinct key, using the first variant's processor
+        owners = {}
+        for key, processor in zip(keys, processors):
+            owners.setdefault(key, processor)
+        def compute_stats(key, processor):
+            # Color stats upscale images in modes like P or LA through PIL
+            if image is not None and key[0] == 'color':
+                return processor.compute_image_stats(image, pixels)
+            return processor.compute_cell_stats(pixels)
+        stats_futures = {key: pool.submit(compute_stats, key, processor)
+                         for key, processor in owners.items()}
+        stats = {key: future.result() for key, future in stats_futures.items()}
+
+        def derive(index):
+            processor = processors[index]
+            if palettes[index] is not None:
+                circles = processor.circles_from_stats(stats[keys[index]], palettes[index])
+            else:
+                circles = processor.circles_from_stats(stats[keys[index]])
+            if return_circles:
+                return circles
+            output = processor.render_array(circles)
+            if not png:
+                return output
+            buffer = BytesIO()
+            Image.fromarray(output).save(buffer, format='PNG', optimize=False)
+            return buffer.getvalue()
+
+        results = list(pool.map(derive, range(len(variants))))
+
+    print(f"Rendered {len(variants)} variants from {len(stats)} statistics passes")
+    return list(zip(processors, results))
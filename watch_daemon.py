@@ -0,0 +1,389 @@
+import argparse
+import json
+import os
+import shutil
+import signal
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from PIL import Image
+from image_handler import ImageHandler
+from processor_factory import create_processor
+from palette_store import load_palette
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:  # inotify is optional, polling works everywhere
+    INotify = None
+
+ALLOWED_EXTENSIONS = {'.png', '.jpg', '.jpeg'}
+MAX_CRASH_RETRIES = 2  # Files that crash more workers on their own are failed
+
+def _warm_worker():
+    """Run a tiny image through both processors so workers start warm."""
+    # The parent handles Ctrl+C and drains the pool itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    image = Image.new('RGB', (16, 16), (128, 128, 128))
+    for mode in ('grayscale', 'color'):
+        params = {
+            'processor_mode': mode, 'num_colors': 4, 'grid_size': None,
+            'smoothing': False, 'smoothing_sigma': 1.5, 'enhance_contrast': False,
+            'invert': False, 'color_palette_size': 4, 'brightness_mapping': 'linear',
+            'gamma': 2.2, 'upscale_factor': 1
+        }
+        create_processor(params).process(image)
+
+def _process_file(path, params, output_dir):
+    """Process one file in a worker process and return the output path."""
+    ImageHandler.validate_image(path)
+    handler = ImageHandler(output_dir)
+    with handler.load_image(path) as image:
+        output = create_processor(params).process(image)
+    output_path = handler.save_image(
+        output,
+        Path(path).stem,
+        params['num_colors'],
+        params['grid_size'] or params['num_colors'],
+        smoothing=params['smoothing'],
+        enhance_contrast=params['enhance_contrast']
+    )
+    return str(output_path)
+
+class DirectoryWatcher:
+    """Block until a directory changes, using inotify when available."""
+
+    def __init__(self, path, use_inotify=True):
+        self.path = Path(path)
+        self._inotify = None
+        if use_inotify and INotify is not None:
+            self._inotify = INotify()
+            self._inotify.add_watch(
+                str(self.path),
+                inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.CREATE
+            )
+
+    @property
+    def backend(self):
+        return 'inotify' if self._inotify else 'polling'
+
+    def wait(self, timeout):
+        """Wait up to timeout seconds, returning early on inotify events."""
+        if self._inotify:
+            self._inotify.read(timeout=int(timeout * 1000))
+        else:
+            time.sleep(timeout)
+
+    def close(self):
+        if self._inotify:
+            self._inotify.close()
+
+class WatchDaemon:
+    """Continuously process images dropped into an input directory.
+
+    A file is only picked up once its size and mtime have been unchanged for
+    settle_seconds, so half-written uploads are left alone. Stable files wait
+    in a bounded queue and are dispatched to a long-lived process pool; when
+    the queue is full, new files simply stay in the input directory until
+    there is room. Processed inputs are moved to done_dir or failed_dir.
+
+    If a worker dies (e.g. killed for running out of memory) the pool is
+    rebuilt and the files that were in flight are queued again. Those files
+    are then retried one at a time, so a crash is only held against the file
+    that was running alone when it happened.
+    """
+
+    def __init__(self, input_dir, output_dir, params, workers=2, settle_seconds=2.0,
+                 poll_interval=1.0, max_queue=100, done_dir=None, failed_dir=None,
+                 status_path=None, use_inotify=True):
+        self.input_dir = Path(input_dir)
+        self.output_dir = Path(output_dir)
+        self.params = params
+        self.workers = workers
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.max_queue = max_queue
+        self.max_in_flight = workers * 2
+        self.done_dir = Path(done_dir) if done_dir else self.input_dir / 'processed'
+        self.failed_dir = Path(failed_dir) if failed_dir else self.input_dir / 'failed'
+        self.status_path = Path(status_path) if status_path else self.input_dir / 'stixis_status.json'
+        self.use_inotify = use_inotify
+
+        for directory in (self.output_dir, self.done_dir, self.failed_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+
+        self._observed = {}  # path -> (size, mtime, first seen with this size/mtime)
+        self._queue = deque()
+        self._in_flight = {}  # future -> (path, start time)
+        self._completions = deque()
+        self._processed = 0
+        self._failed = 0
+        self._last_error = None
+        self._crashes = {}  # path -> number of worker crashes while running alone
+        self._suspects = set()  # files in flight during a crash, retried one at a time
+        self._pool_error = None
+        self._pool_restarts = 0
+        self._last_pool_error = None
+        self._started = time.time()
+        self._running = False
+
+    def stop(self, *args):
+        """Stop after the files already dispatched have finished."""
+        self._running = False
+
+    def _known(self, path):
+        return path in self._queue or any(p == path for p, _ in self._in_flight.values())
+
+    def scan(self):
+        """Promote files whose size and mtime have settled into the queue."""
+        now = time.time()
+        present = set()
+        for entry in os.scandir(self.input_dir):
+            path = Path(entry.path)
+            if (not entry.is_file() or entry.name.startswith('.')
+                    or path.suffix.lower() not in ALLOWED_EXTENSIONS):
+                continue
+            present.add(path)
+            if self._known(path):
+                continue
+
+            stat = entry.stat()
+            signature = (stat.st_size, stat.st_mtime)
+            observed = self._observed.get(path)
+            if observed is None or observed[:2] != signature:
+                self._observed[path] = (*signature, now)
+            elif now - observed[2] >= self.settle_seconds and len(self._queue) < self.max_queue:
+                del self._observed[path]
+                self._queue.append(path)
+
+        # Forget files that disappeared before settling
+        for path in list(self._observed):
+            if path not in present:
+                del self._observed[path]
+
+    def dispatch(self, pool):
+        """Send queued files to the pool while there is capacity."""
+        while self._queue and len(self._in_flight) < self.max_in_flight:
+            if self._suspects:
+                # Isolate files that were in flight during a crash
+                if self._in_flight:
+                    return
+                path = next((p for p in self._queue if p in self._suspects), None)
+                if path is None:
+                    self._suspects.clear()
+                    continue
+                self._queue.remove(path)
+            else:
+                path = self._queue.popleft()
+            try:
+                future = pool.submit(_process_file, str(path), self.params, str(self.output_dir))
+            except BrokenProcessPool as e:
+                self._queue.appendleft(path)
+                self._pool_error = str(e)
+                return
+            self._in_flight[future] = (path, time.time())
+
+    def collect(self):
+        """Move finished inputs aside and record the results."""
+        for future in [f for f in self._in_flight if f.done()]:
+            path, started = self._in_flight.pop(future)
+            try:
+                output_path = future.result()
+                self._processed += 1
+                self._crashes.pop(path, None)
+                self._suspects.discard(path)
+                self._move(path, self.done_dir)
+                print(f"Processed {path.name} -> {output_path} ({time.time() - started:.1f}s)")
+            except BrokenProcessPool as e:
+                # The worker died; the file itself is usually fine, so retry it.
+                # Suspects run alone, so only then is the crash this file's fault
+                self._pool_error = str(e)
+                if path in self._suspects:
+                    self._crashes[path] = self._crashes.get(path, 0) + 1
+                self._suspects.add(path)
+                if self._crashes.get(path, 0) <= MAX_CRASH_RETRIES:
+                    self._queue.appendleft(path)
+                    print(f"Worker crashed while processing {path.name}, queued again")
+                    continue
+                del self._crashes[path]
+                self._suspects.discard(path)
+                self._failed += 1
+                self._last_error = f"{path.name}: worker crashed {MAX_CRASH_RETRIES + 1} times"
+                self._move(path, self.failed_dir)
+                print(f"Error processing {path.name}: worker crashed {MAX_CRASH_RETRIES + 1} times")
+            except Exception as e:
+                self._failed += 1
+                self._crashes.pop(path, None)
+                self._suspects.discard(path)
+                self._last_error = f"{path.name}: {str(e)}"
+                self._move(path, self.failed_dir)
+                print(f"Error processing {path.name}: {str(e)}")
+            self._completions.append(time.time())
+
+    def _create_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker)
+
+    def _restart_pool(self, pool):
+        """Replace a broken pool with a fresh, warmed one."""
+        # A broken pool fails all of its futures; collect them first
+        while self._in_flight:
+            time.sleep(0.05)
+            self.collect()
+        pool.shutdown(wait=True)
+        
+        self._pool_restarts += 1
+        self._last_pool_error = self._pool_error
+        self._pool_error = None
+        print(f"Worker pool broke ({self._last_pool_error}), restarting")
+        return self._create_pool()
+
+    def _move(self, path, directory):
+        target = directory / path.name
+        if target.exists():
+            target = directory / f"{path.stem}_{int(time.time() * 1000)}{path.suffix}"
+        try:
+            shutil.move(str(path), str(target))
+        except OSError as e:
+            print(f"Error moving {path.name}: {str(e)}")
+
+    def status(self):
+        """Return the current daemon status."""
+        now = time.time()
+        while self._completions and now - self._completions[0] > 60:
+            self._completions.popleft()
+        uptime = now - self._started
+        return {
+            'pid': os.getpid(),
+            'running': self._running,
+            'uptime_seconds': round(uptime, 1),
+            'queue_depth': len(self._queue),
+            'settling': len(self._observed),
+            'in_flight': len(self._in_flight),
+            'crash_suspects': len(self._suspects),
+            'workers': self.workers,
+            'processed': self._processed,
+            'failed': self._failed,
+            'throughput_last_minute': len(self._completions),
+            'throughput_per_minute_avg': round((self._processed + self._failed) * 60 / uptime, 2) if uptime else 0,
+            'last_error': self._last_error,
+            'pool_restarts': self._pool_restarts,
+            'last_pool_error': self._last_pool_error,
+            'updated_at': now,
+        }
+
+    def write_status(self):
+        """Atomically replace the status file."""
+        tmp_path = self.status_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.status(), f, indent=2)
+        os.replace(tmp_path, self.status_path)
+
+    def run(self):
+        """Run until stopped by SIGINT/SIGTERM."""
+        self._running = True
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        watcher = DirectoryWatcher(self.input_dir, self.use_inotify)
+        print(f"Watching {self.input_dir} ({watcher.backend}) with {self.workers} workers")
+
+        pool = self._create_pool()
+        try:
+            while self._running:
+                self.scan()
+                self.dispatch(pool)
+                self.collect()
+                if self._pool_error:
+                    pool = self._restart_pool(pool)
+                    self.dispatch(pool)
+                self.write_status()
+                # Settling files need a rescan even without new events
+                timeout = self.poll_interval
+                if self._observed or self._in_flight:
+                    timeout = min(timeout, 0.25)
+                watcher.wait(timeout)
+
+            print("Stopping, waiting for files in progress")
+            while self._in_flight:
+                time.sleep(0.1)
+                self.collect()
+        finally:
+            pool.shutdown(wait=True)
+            watcher.close()
+            self.write_status()
+
+def main():
+    parser = argparse.ArgumentParser(description='Stixis - Watch folder daemon')
+    parser.add_argument('input_dir', type=str, help='Directory to watch for new images')
+    parser.add_argument('--output-dir', type=str, help='Output directory (default: <input>/output)')
+    parser.add_argument('--done-dir', type=str, help='Where processed inputs are moved')
+    parser.add_argument('--failed-dir', type=str, help='Where failed inputs are moved')
+    parser.add_argument('--status-file', type=str, help='Status file path')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2,
+                        help='Number of worker processes')
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help='Seconds a file must be unchanged before processing')
+    parser.add_argument('--poll-interval', type=float, default=1.0,
+                        help='Seconds between directory scans')
+    parser.add_argument('--max-queue', type=int, default=100,
+                        help='Maximum number of files waiting for a worker')
+    parser.add_argument('--no-inotify', action='store_true', help='Always use polling')
+    parser.add_argument('--colors', type=int, default=5, help='Number of circle sizes (2-10)')
+    parser.add_argument('--grid-size', type=int, help='Number of grid divisions (4+)')
+    parser.add_argument('--smooth', action='store_true', help='Apply smoothing')
+    parser.add_argument('--sigma', type=float, default=1.5, help='Smoothing sigma value')
+    parser.add_argument('--contrast', action='store_true', help='Enhance contrast')
+    parser.add_argument('--invert', action='store_true', help='Invert colors')
+    parser.add_argument('--mode', choices=['grayscale', 'color'], default='grayscale',
+                        help='Processing mode (grayscale/color)')
+    parser.add_argument('--palette-size', type=int, default=8,
+                        help='Number of colors in palette (color mode only)')
+    parser.add_argument('--palette-file', type=str,
+                        help='Use a saved palette for every image (color mode only)')
+    parser.add_argument('--mapping', choices=['linear', 'logarithmic', 'exponential',
+                                              'sigmoid', 'power', 'adaptive'],
+                        default='linear', help='Brightness mapping mode')
+    parser.add_argument('--gamma', type=float, default=2.2,
+                        help='Gamma value for power mapping')
+    parser.add_argument('--upscale', type=int, choices=[1, 2, 4, 8], default=1,
+                        help='Upscale factor for better quality (1x, 2x, 4x, 8x)')
+    args = parser.parse_args()
+
+    input_dir = Path(args.input_dir)
+    if not input_dir.is_dir():
+        print(f"Error: Input directory '{args.input_dir}' does not exist")
+        return
+
+    params = {
+        'processor_mode': args.mode,
+        'num_colors': args.colors,
+        'grid_size': args.grid_size,
+        'smoothing': args.smooth,
+        'smoothing_sigma': args.sigma,
+        'enhance_contrast': args.contrast,
+        'invert': args.invert,
+        'color_palette_size': args.palette_size,
+        'brightness_mapping': args.mapping,
+        'gamma': args.gamma,
+        'upscale_factor': args.upscale,
+        'palette': load_palette(args.palette_file) if args.palette_file else None,
+    }
+
+    daemon = WatchDaemon(
+        input_dir,
+        args.output_dir or input_dir / 'output',
+        params,
+        workers=args.workers,
+        settle_seconds=args.settle,
+        poll_interval=args.poll_interval,
+        max_queue=args.max_queue,
+        done_dir=args.done_dir,
+        failed_dir=args.failed_dir,
+        status_path=args.status_file,
+        use_inotify=not args.no_inotify
+    )
+    daemon.run()
+
+if __name__ == "__main__":
+    main()